@@ -0,0 +1,265 @@
+"""Двоичный формат хранения массивов в БД.
+
+Каждый закодированный массив начинается с байта-признака формата:
+
+* FMT_INT64 - упакованные little-endian int64 (8 байт на элемент);
+* FMT_DELTA - разности соседних элементов в zigzag/varint, удобно для
+  отсортированных массивов с небольшим шагом;
+* FMT_BIGINT - JSON в UTF-8 для значений, не помещающихся в int64;
+* FMT_REF - ссылка на содержимое по хешу (content_hash), массив хранится
+  в хранилище один раз; такие значения разрешает SqliteStorage;
+* FMT_EXTERN - смещение и длина массива во внешнем файле данных
+  (blob_store.MmapBlobStore), тоже разрешается SqliteStorage;
+* FMT_PATCH - правка относительно родительского массива (array_delta),
+  применяется SqliteStorage к родительской записи.
+
+Строки, сохранённые до перехода на двоичный формат, хранятся в БД как TEXT
+с JSON и по-прежнему декодируются функцией decode_array.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import struct
+import sys
+from array import array
+from itertools import accumulate, islice
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+try:  # NumPy необязателен
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+FMT_INT64 = 1
+FMT_DELTA = 2
+FMT_BIGINT = 3
+FMT_REF = 4
+FMT_EXTERN = 5
+FMT_PATCH = 6
+
+ARRAY_KINDS = ("list", "array", "numpy", "memoryview")
+
+_BIG_ENDIAN = sys.byteorder == "big"
+_EXTERN = struct.Struct("<QQ")
+# Наибольшая длина zigzag-varint для значения int64.
+_MAX_VARINT = 10
+
+
+def encode_array(values: Sequence[int], delta: bool = False) -> bytes:
+    """Кодирует массив целых в двоичный вид.
+
+    При delta=True используется разностное varint-кодирование.
+    Значения вне диапазона int64 автоматически сохраняются в FMT_BIGINT.
+    """
+    try:
+        packed = values if isinstance(values, array) and values.typecode == "q" else array("q", values)
+    except OverflowError:
+        return bytes((FMT_BIGINT,)) + json.dumps(list(values)).encode("utf-8")
+
+    if delta:
+        try:
+            return bytes((FMT_DELTA,)) + _encode_deltas(packed)
+        except OverflowError:
+            # Разность двух int64 может выйти за 64 бита - пишем без сжатия.
+            pass
+
+    if _BIG_ENDIAN:
+        packed = array("q", packed)
+        packed.byteswap()
+    return bytes((FMT_INT64,)) + packed.tobytes()
+
+
+def decode_array(payload: Union[bytes, str], kind: str = "list") -> Any:
+    """Декодирует массив из БД.
+
+    kind задаёт тип результата: "list", "array" (array('q')), "numpy" или
+    "memoryview" (формат "q"). Для FMT_BIGINT и kind != "list" возвращается
+    список: такие значения не помещаются в типизированный массив. Массив NumPy
+    и memoryview для FMT_INT64 являются представлениями поверх payload без
+    копирования и доступны только для чтения.
+    """
+    if isinstance(payload, str):
+        values = json.loads(payload)
+        if kind == "list":
+            return values
+        payload = encode_array(values)
+
+    fmt = payload[0]
+    if fmt == FMT_BIGINT:
+        return json.loads(bytes(payload[1:]).decode("utf-8"))
+
+    if fmt == FMT_INT64:
+        if kind == "numpy" and np is not None:
+            return np.frombuffer(payload, dtype="<i8", offset=1).astype(np.int64, copy=False)
+        if kind == "memoryview" and not _BIG_ENDIAN:
+            return memoryview(payload)[1:].cast("q")
+        result = array("q")
+        result.frombytes(memoryview(payload)[1:])
+        if _BIG_ENDIAN:
+            result.byteswap()
+    elif fmt == FMT_DELTA:
+        values_iter = accumulate(_iter_varints(payload, 1))
+        if kind == "numpy" and np is not None:
+            return np.fromiter(values_iter, dtype=np.int64)
+        result = array("q", values_iter)
+    elif fmt in (FMT_REF, FMT_EXTERN, FMT_PATCH):
+        raise ValueError("Ссылка на содержимое должна разрешаться хранилищем")
+    else:
+        raise ValueError(f"Неизвестный формат массива: {fmt}")
+
+    return _as_kind(result, kind)
+
+
+def prefix_size(limit: int) -> int:
+    """Сколько начальных байт payload достаточно decode_prefix для limit элементов."""
+    return 1 + _MAX_VARINT * limit
+
+
+def decode_prefix(payload: Union[bytes, str], limit: int) -> Optional[List[int]]:
+    """Первые limit элементов массива по началу payload (не короче
+    prefix_size(limit) байт) без декодирования остального.
+
+    Возвращает None для форматов, которые так не читаются: JSON и
+    FMT_BIGINT (нужен payload целиком), а также ссылки и правки, которые
+    разрешает хранилище.
+    """
+    if isinstance(payload, str) or not payload:
+        return None
+    fmt = payload[0]
+    if fmt == FMT_INT64:
+        result = array("q")
+        result.frombytes(memoryview(payload)[1 : 1 + 8 * limit])
+        if _BIG_ENDIAN:
+            result.byteswap()
+        return result.tolist()
+    if fmt == FMT_DELTA:
+        # Незаконченный varint в конце обрезанного payload не выдаётся.
+        return list(islice(accumulate(_iter_varints(payload, 1)), limit))
+    return None
+
+
+def to_kind(values: Sequence[int], kind: str) -> Any:
+    """Приводит список целых к типу результата decode_array (см. kind)."""
+    if kind == "list":
+        return list(values)
+    try:
+        packed = array("q", values)
+    except OverflowError:
+        return list(values)
+    return _as_kind(packed, kind)
+
+
+def _as_kind(result: array, kind: str) -> Any:
+    if kind == "list":
+        return result.tolist()
+    if kind == "numpy" and np is not None:
+        return np.frombuffer(result, dtype=np.int64)
+    if kind == "memoryview":
+        return memoryview(result)
+    return result
+
+
+def content_hash(values: Sequence[int]) -> bytes:
+    """16-байтовый хеш BLAKE2b канонического (FMT_INT64/FMT_BIGINT) представления."""
+    return hashlib.blake2b(encode_array(values), digest_size=16).digest()
+
+
+def encode_ref(digest: bytes) -> bytes:
+    return bytes((FMT_REF,)) + digest
+
+
+def ref_digest(payload: Any) -> Optional[bytes]:
+    """Хеш из ссылки FMT_REF или None, если payload - не ссылка."""
+    if isinstance(payload, bytes) and payload[:1] == bytes((FMT_REF,)):
+        return payload[1:]
+    return None
+
+
+def encode_extern(offset: int, count: int) -> bytes:
+    return bytes((FMT_EXTERN,)) + _EXTERN.pack(offset, count)
+
+
+def extern_location(payload: Any) -> Optional[Tuple[int, int]]:
+    """(смещение, длина) из ссылки FMT_EXTERN или None для других форматов."""
+    if isinstance(payload, bytes) and payload[:1] == bytes((FMT_EXTERN,)):
+        return _EXTERN.unpack(payload[1:])
+    return None
+
+
+def encode_patch(
+    length: int,
+    updates: Sequence[Tuple[int, int, int]],
+    appended: Sequence[int],
+    truncated: Sequence[int],
+) -> bytes:
+    """Кодирует правку массива: итоговую длину, замены (индекс, было, стало),
+    дописанные в конец и отрезанные с конца значения. Все числа - zigzag
+    varint, индексы замен - разностями от предыдущего.
+    """
+    fields = [length, len(updates)]
+    prev = 0
+    for index, old, new in updates:
+        fields += (index - prev, old, new)
+        prev = index
+    fields.append(len(appended))
+    fields += appended
+    fields.append(len(truncated))
+    fields += truncated
+    return bytes((FMT_PATCH,)) + _encode_varints(fields)
+
+
+def decode_patch(
+    payload: bytes,
+) -> Tuple[int, List[Tuple[int, int, int]], List[int], List[int]]:
+    """Обратное к encode_patch: (длина, замены, дописанные, отрезанные)."""
+    it = _iter_varints(payload, 1)
+    length = next(it)
+    updates = []
+    index = 0
+    for _ in range(next(it)):
+        index += next(it)
+        old = next(it)
+        updates.append((index, old, next(it)))
+    appended = list(islice(it, next(it)))
+    truncated = list(islice(it, next(it)))
+    return length, updates, appended, truncated
+
+
+def _encode_deltas(values: Sequence[int]) -> bytes:
+    return _encode_varints(_deltas(values))
+
+
+def _deltas(values: Sequence[int]) -> Iterator[int]:
+    prev = 0
+    for x in values:
+        yield x - prev
+        prev = x
+
+
+def _encode_varints(values: Iterable[int]) -> bytes:
+    out = bytearray()
+    for d in values:
+        if not -(2**63) <= d < 2**63:
+            raise OverflowError(d)
+        z = (d << 1) ^ (d >> 63)
+        while z >= 0x80:
+            out.append((z & 0x7F) | 0x80)
+            z >>= 7
+        out.append(z)
+    return bytes(out)
+
+
+def _iter_varints(data: bytes, pos: int) -> Iterator[int]:
+    value = 0
+    shift = 0
+    for i in range(pos, len(data)):
+        b = data[i]
+        value |= (b & 0x7F) << shift
+        if b & 0x80:
+            shift += 7
+            continue
+        yield (value >> 1) ^ -(value & 1)
+        value = 0
+        shift = 0
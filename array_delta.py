@@ -0,0 +1,94 @@
+"""Правки массива относительно родительского (сохранённого ранее) массива.
+
+Пользователь загружает массив из истории, меняет несколько элементов или
+дописывает значения в конец. Такая правка описывается ArrayDelta: замены по
+индексам, дописанные и отрезанные с конца значения. По ней можно получить
+новый массив из родительского (apply) и новый отсортированный массив из
+родительского отсортированного (apply_sorted, за O(k log n) вместо полной
+сортировки), а хранилище может сохранить её вместо полной копии.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+from array_codec import decode_patch, encode_patch
+from sort_alg import merge_sorted_delta
+
+# Сравнение массивов идёт блоками: равные блоки сравниваются одной
+# операцией над срезами, поэлементно просматриваются только изменённые.
+_DIFF_BLOCK = 4096
+
+
+@dataclass
+class ArrayDelta:
+    length: int
+    updates: List[Tuple[int, int, int]] = field(default_factory=list)  # (индекс, было, стало)
+    appended: List[int] = field(default_factory=list)
+    truncated: List[int] = field(default_factory=list)
+
+    @property
+    def size(self) -> int:
+        """Число изменённых элементов (k)."""
+        return len(self.updates) + len(self.appended) + len(self.truncated)
+
+    @property
+    def removed(self) -> List[int]:
+        return [old for _, old, _ in self.updates] + self.truncated
+
+    @property
+    def added(self) -> List[int]:
+        return [new for _, _, new in self.updates] + self.appended
+
+    def apply(self, parent: Sequence[int]) -> List[int]:
+        """Новый массив из родительского."""
+        keep = self.length - len(self.appended)
+        result = list(parent[:keep])
+        for index, _, new in self.updates:
+            result[index] = new
+        result += self.appended
+        return result
+
+    def apply_sorted(self, parent_sorted: Sequence[int]) -> List[int]:
+        """Новый отсортированный массив из родительского отсортированного."""
+        return merge_sorted_delta(parent_sorted, self.removed, self.added)
+
+    def encode(self) -> bytes:
+        return encode_patch(self.length, self.updates, self.appended, self.truncated)
+
+    @classmethod
+    def decode(cls, payload: bytes) -> "ArrayDelta":
+        return cls(*decode_patch(payload))
+
+
+def diff_arrays(
+    parent: Sequence[int],
+    new: Sequence[int],
+    max_changes: Optional[int] = None,
+) -> Optional[ArrayDelta]:
+    """Правка, превращающая parent в new, или None, если изменено больше
+    max_changes элементов (по умолчанию - восьмая часть длины new).
+
+    Учитываются замены на месте и изменения в конце массива; вставка или
+    удаление в середине сдвигает все последующие элементы и обычно делает
+    правку слишком большой - тогда массив нужно сохранять целиком.
+    """
+    if max_changes is None:
+        # Без нижней границы: иначе короткий массив, никак не связанный с
+        # parent, сохранялся бы правкой и зависел бы от чужой записи.
+        max_changes = len(new) // 8
+    common = min(len(parent), len(new))
+    delta = ArrayDelta(length=len(new), appended=list(new[common:]), truncated=list(parent[common:]))
+    if delta.size > max_changes:
+        return None
+    for start in range(0, common, _DIFF_BLOCK):
+        end = min(start + _DIFF_BLOCK, common)
+        if parent[start:end] == new[start:end]:
+            continue
+        for i in range(start, end):
+            if parent[i] != new[i]:
+                delta.updates.append((i, parent[i], new[i]))
+        if delta.size > max_changes:
+            return None
+    return delta
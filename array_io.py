@@ -0,0 +1,84 @@
+"""Потоковое чтение массивов из файлов.
+
+Поддерживаемые форматы (определяются по расширению):
+
+* .jsonl - по одному JSON-массиву в строке;
+* .csv / .txt - по одному массиву в строке, числа через запятую;
+* .bin - последовательность записей: длина (uint32 LE), затем значения (int64 LE).
+
+Файлы читаются построчно/позаписно, поэтому память не зависит от размера файла.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import struct
+import sys
+from array import array
+from typing import BinaryIO, Iterable, Iterator, List, Sequence, Union
+
+PathLike = Union[str, "os.PathLike[str]"]
+
+_HEADER = struct.Struct("<I")
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+def iter_arrays_file(path: PathLike) -> Iterator[Sequence[int]]:
+    """Итератор по массивам из файла; формат выбирается по расширению."""
+    ext = os.path.splitext(os.fspath(path))[1].lower()
+    if ext == ".jsonl":
+        return iter_jsonl(path)
+    if ext in (".csv", ".txt"):
+        return iter_csv(path)
+    if ext == ".bin":
+        return iter_binary(path)
+    raise ValueError(f"Неподдерживаемый формат файла: {ext or '(без расширения)'}")
+
+
+def iter_jsonl(path: PathLike) -> Iterator[List[int]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_csv(path: PathLike) -> Iterator[List[int]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield [int(x) for x in line.split(",")]
+
+
+def iter_binary(path: PathLike) -> Iterator[array]:
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if not header:
+                return
+            if len(header) < _HEADER.size:
+                raise ValueError("Файл обрывается посреди заголовка записи")
+            (n,) = _HEADER.unpack(header)
+            values = array("q")
+            try:
+                values.fromfile(f, n)
+            except EOFError:
+                raise ValueError("Файл обрывается посреди записи") from None
+            if _BIG_ENDIAN:
+                values.byteswap()
+            yield values
+
+
+def write_binary(f: BinaryIO, arrays: Iterable[Sequence[int]]) -> int:
+    """Записывает массивы в формате .bin; возвращает количество записей."""
+    written = 0
+    for arr in arrays:
+        values = array("q", arr)
+        if _BIG_ENDIAN:
+            values.byteswap()
+        f.write(_HEADER.pack(len(values)))
+        values.tofile(f)
+        written += 1
+    return written
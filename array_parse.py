@@ -0,0 +1,131 @@
+"""Разбор массивов целых чисел из текста: поле ввода, буфер обмена, файл.
+
+Числа разделяются запятыми и/или пробельными символами, включая переводы
+строк; пустые элементы ("1,,2") пропускаются. Текст обрабатывается
+порциями по CHUNK_CHARS символов за один проход: порция разбивается одним
+вызовом split(), и числа сразу дописываются в результат (array('q') или
+список), так что промежуточные строки не больше порции. Число, разрезанное
+границей порций, переносится в следующую.
+
+При ошибке выбрасывается ArrayParseError с точным положением первого
+неверного токена: смещение от начала текста, строка и столбец.
+"""
+
+from __future__ import annotations
+
+import re
+from array import array
+from typing import Callable, Iterable, List, Optional, Union
+
+from array_io import PathLike
+
+CHUNK_CHARS = 1 << 20
+_TOKEN = re.compile(r"[^\s,]+")
+
+Parsed = Union[array, List[int]]
+
+
+class ArrayParseError(ValueError):
+    """Неверный токен во входном тексте.
+
+    offset - смещение токена от начала текста (в символах), line и column
+    считаются с 1.
+    """
+
+    def __init__(self, reason: str, token: str, offset: int, line: int, column: int):
+        self.reason = reason
+        self.token = token
+        self.offset = offset
+        self.line = line
+        self.column = column
+        shown = token if len(token) <= 40 else token[:37] + "..."
+        super().__init__(f"{reason}: '{shown}' (строка {line}, столбец {column})")
+
+
+def parse_array(
+    text: str,
+    typecode: Optional[str] = "q",
+    progress: Optional[Callable[[int], None]] = None,
+) -> Parsed:
+    """Массив из текста. typecode - тип array (по умолчанию int64) или None,
+    чтобы получить список без ограничения на размер чисел."""
+    chunks = (text[i : i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS))
+    return parse_chunks(chunks, typecode, progress)
+
+
+def parse_array_file(
+    path: PathLike,
+    typecode: Optional[str] = "q",
+    progress: Optional[Callable[[int], None]] = None,
+    chunk_chars: int = CHUNK_CHARS,
+) -> Parsed:
+    """Массив из текстового файла (UTF-8); файл читается порциями."""
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_chunks(iter(lambda: f.read(chunk_chars), ""), typecode, progress)
+
+
+def parse_chunks(
+    chunks: Iterable[str],
+    typecode: Optional[str] = "q",
+    progress: Optional[Callable[[int], None]] = None,
+) -> Parsed:
+    """Разбирает текст, поданный порциями произвольной длины.
+
+    progress(число_разобранных_значений) вызывается после каждой порции;
+    исключение из него прерывает разбор (так работает отмена в GUI).
+    """
+    out: Parsed = array(typecode) if typecode is not None else []
+    tail = ""  # незаконченный токен с конца предыдущей порции
+    offset = 0  # смещение начала text во всём тексте
+    lines = 0  # переводов строк до offset
+    line_start = 0  # смещение начала текущей строки
+    for chunk in chunks:
+        text = tail + chunk
+        tokens = text.replace(",", " ").split()
+        # Последний токен может продолжаться в следующей порции.
+        tail = tokens.pop() if tokens and not text[-1].isspace() and text[-1] != "," else ""
+        done = len(text) - len(tail)
+        try:
+            out.extend(map(int, tokens))  # type: ignore[arg-type]
+        except (ValueError, OverflowError):
+            _raise_at(text, offset, lines, line_start, typecode)
+        newlines = text.count("\n", 0, done)
+        if newlines:
+            lines += newlines
+            line_start = offset + text.rfind("\n", 0, done) + 1
+        offset += done
+        if progress is not None:
+            progress(len(out))
+    if tail:
+        try:
+            out.append(int(tail))
+        except (ValueError, OverflowError):
+            _raise_at(tail, offset, lines, line_start, typecode)
+    return out
+
+
+def _raise_at(text: str, offset: int, lines: int, line_start: int, typecode: Optional[str]) -> None:
+    """Находит в text первый неверный токен и выбрасывает ArrayParseError."""
+    probe = array(typecode) if typecode is not None else None
+    for m in _TOKEN.finditer(text):
+        token = m.group()
+        try:
+            value = int(token)
+        except ValueError:
+            reason = "Неверное число"
+        else:
+            if probe is None:
+                continue
+            try:
+                probe.append(value)
+            except OverflowError:
+                reason = f"Число не помещается в тип '{typecode}'"
+            else:
+                probe.pop()
+                continue
+        start = offset + m.start()
+        newlines = text.count("\n", 0, m.start())
+        if newlines:
+            line_start = offset + text.rfind("\n", 0, m.start()) + 1
+        raise ArrayParseError(reason, token, start, lines + newlines + 1, start - line_start + 1)
+    raise ArrayParseError("Неверное число", text.strip(), offset, lines + 1, offset - line_start + 1)
@@ -0,0 +1,132 @@
+"""Асинхронный интерфейс к SqliteStorage для asyncio-сервисов.
+
+Все операции выполняются в собственном ограниченном пуле потоков, поэтому
+цикл событий не блокируется. Каждый поток пула держит постоянные соединения
+(см. SqliteStorage._thread_conn). Одновременные вызовы save_arrays
+объединяются в групповые коммиты очередью write_queue.WriteBehindQueue: пока
+идёт запись одной пачки, следующие запросы накапливаются и записываются
+одной транзакцией.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+from db_layer import SqliteStorage
+from write_queue import QueueFullError, WriteBehindQueue
+
+
+class AsyncSqliteStorage:
+    def __init__(
+        self,
+        db_path: str,
+        max_workers: int = 4,
+        max_batch: int = 256,
+        max_pending: int = 10_000,
+        max_delay: float = 0.0,
+        **storage_kwargs: Any,
+    ):
+        """max_batch - наибольший размер группового коммита,
+        max_pending - сколько сохранений может ждать записи; следующие
+        вызовы save_arrays ждут освобождения места (обратное давление),
+        max_delay - сколько секунд первое сохранение ждёт попутчиков
+        (0 - пачку составляет то, что накопилось за время предыдущей записи).
+        Остальные аргументы передаются в SqliteStorage.
+        """
+        self.storage = SqliteStorage(db_path, **storage_kwargs)
+        self.max_batch = max_batch
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="async-storage")
+        self._queue = WriteBehindQueue(
+            self.storage, max_batch=max_batch, max_delay=max_delay, max_pending=max_pending
+        )
+
+    async def _run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    # -------------------- Пользователи --------------------
+
+    async def register_user(self, username: str, password: str) -> Tuple[bool, str]:
+        return await self._run(self.storage.register_user, username, password)
+
+    async def authenticate_user(self, username: str, password: str) -> Tuple[bool, Any]:
+        return await self._run(self.storage.authenticate_user, username, password)
+
+    # -------------------- Массивы --------------------
+
+    async def save_arrays(
+        self,
+        user_id: int,
+        original: Sequence[int],
+        sorted_values: Optional[Sequence[int]],
+    ) -> Tuple[bool, str]:
+        try:
+            future = self._queue.submit(user_id, original, sorted_values, timeout=0)
+        except QueueFullError:
+            # Очередь полна - ждём места в потоке пула, а не в цикле событий.
+            future = await self._run(self._queue.submit, user_id, original, sorted_values)
+        # Отмена ожидающей корутины отменяет и ещё не записанное сохранение.
+        return await asyncio.wrap_future(future)
+
+    async def list_user_arrays(
+        self,
+        user_id: int,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = 100,
+        include_payload: bool = False,
+    ) -> Tuple[bool, Any]:
+        return await self._run(self.storage.list_user_arrays, user_id, after_id, limit, include_payload)
+
+    async def iter_user_arrays(
+        self,
+        user_id: int,
+        page_size: int = 500,
+        include_payload: bool = False,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Асинхронный обход всей истории пользователя страницами по page_size."""
+        after_id = None
+        while True:
+            ok, page = await self.list_user_arrays(user_id, after_id, page_size, include_payload)
+            if not ok:
+                raise RuntimeError(page)
+            for item in page:
+                yield item
+            if len(page) < page_size:
+                return
+            after_id = page[-1]["id"]
+
+    async def get_user_array(self, user_id: int, array_id: int) -> Tuple[bool, Any]:
+        return await self._run(self.storage.get_user_array, user_id, array_id)
+
+    async def random_arrays(self, count: int, **filters: Any) -> List[Any]:
+        return await self._run(self.storage.random_arrays, count, **filters)
+
+    async def insert_bulk_test_arrays(self, arrays: List[Sequence[int]]) -> bool:
+        return await self._run(self.storage.insert_bulk_test_arrays, arrays)
+
+    async def total_count(self) -> int:
+        return await self._run(self.storage.total_count)
+
+    async def array_stats(self, user_id: Optional[int] = None) -> Dict[str, Any]:
+        return await self._run(self.storage.array_stats, user_id)
+
+    async def clear_all_arrays(self) -> bool:
+        return await self._run(self.storage.clear_all_arrays)
+
+    async def purge_arrays(self, **rules: Any) -> Tuple[bool, Any]:
+        return await self._run(self.storage.purge_arrays, **rules)
+
+    async def close(self) -> None:
+        """Дожидается записи накопленных сохранений и закрывает соединения."""
+        await self._run(self._queue.close)
+        await self._run(self.storage.close)
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self) -> "AsyncSqliteStorage":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.close()
@@ -0,0 +1,224 @@
+"""Хранение паролей и быстрая проверка входа.
+
+Пароли хранятся в users.password_hash в самоописывающем виде
+"scrypt$n$r$p$соль$хеш" (или "pbkdf2_sha256$итерации$соль$хеш", если
+OpenSSL собран без scrypt): у каждого пользователя своя соль и параметры,
+поэтому их можно усиливать со временем. Старые строки с несолёным SHA-256
+принимаются и заменяются новым хешем при следующем успешном входе.
+
+Authenticator выполняет адаптивное хеширование в пуле потоков (hashlib
+отпускает GIL) и запоминает успешные проверки и выданные токены сессий на
+ограниченное время, так что повторные запросы не хешируют пароль заново.
+"""
+
+from __future__ import annotations
+
+import base64
+import functools
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Generic, Optional, Tuple, TypeVar
+
+if TYPE_CHECKING:
+    from db_layer import SqliteStorage, User
+
+# Параметры для новых хешей: scrypt с n=2^14, r=8 требует ~16 МБ памяти и
+# десятки миллисекунд CPU на одну проверку.
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600_000
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+_HAS_SCRYPT = hasattr(hashlib, "scrypt")
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+def hash_password(password: str, salt: Optional[bytes] = None) -> str:
+    """Солёный адаптивный хеш пароля в формате для users.password_hash."""
+    salt = salt if salt is not None else secrets.token_bytes(SALT_BYTES)
+    if _HAS_SCRYPT:
+        digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, PBKDF2_ITERATIONS, HASH_BYTES)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+
+
+def verify_password(password: str, stored: str) -> Tuple[bool, bool]:
+    """Проверяет пароль по сохранённому хешу.
+
+    Возвращает (совпал, нужно_обновить): второй флаг выставляется для
+    устаревших форматов и параметров слабее текущих.
+    """
+    parts = stored.split("$")
+    if parts[0] == "scrypt" and len(parts) == 6:
+        n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+        expected = _unb64(parts[5])
+        digest = _scrypt(password, _unb64(parts[4]), n, r, p, len(expected))
+        outdated = (n, r, p) < (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    elif parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+        iterations = int(parts[1])
+        expected = _unb64(parts[3])
+        digest = hashlib.pbkdf2_hmac(
+            "sha256", password.encode("utf-8"), _unb64(parts[2]), iterations, len(expected)
+        )
+        outdated = _HAS_SCRYPT or iterations < PBKDF2_ITERATIONS
+    else:
+        # Формат до перехода на соль: шестнадцатеричный SHA-256.
+        expected = stored.encode("ascii", "replace")
+        digest = hashlib.sha256(password.encode("utf-8")).hexdigest().encode("ascii")
+        outdated = True
+    ok = hmac.compare_digest(digest, expected)
+    return ok, ok and outdated
+
+
+def verify_dummy(password: str) -> None:
+    """Проверка против случайного хеша для несуществующих пользователей:
+    время ответа не должно выдавать, есть ли такой логин."""
+    verify_password(password, _dummy_hash())
+
+
+@functools.lru_cache(maxsize=1)
+def _dummy_hash() -> str:
+    return hash_password(secrets.token_urlsafe(16))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int, dklen: int = HASH_BYTES) -> bytes:
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=n, r=r, p=p, dklen=dklen, maxmem=256 * n * r + (1 << 20)
+    )
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+class TtlCache(Generic[K, V]):
+    """Ограниченный словарь: при переполнении вытесняются давно не
+    использованные записи, каждая запись живёт не дольше ttl секунд."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: K, value: V) -> None:
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def pop(self, key: K) -> Optional[V]:
+        with self._lock:
+            entry = self._items.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class Authenticator:
+    """Проверка входа с пулом хеширования и кешем успешных проверок.
+
+    Кеш хранит не пароль, а HMAC от него с секретом, который живёт только в
+    памяти процесса. Неудачные попытки не кешируются: каждая стоит полного
+    адаптивного хеша.
+    """
+
+    def __init__(
+        self,
+        storage: "SqliteStorage",
+        workers: int = 4,
+        cache_size: int = 10_000,
+        ttl: float = 300.0,
+        session_ttl: float = 3600.0,
+    ):
+        self.storage = storage
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="auth")
+        self._secret = secrets.token_bytes(32)
+        self._verified: TtlCache[str, Tuple[bytes, "User"]] = TtlCache(cache_size, ttl)
+        self._sessions: TtlCache[str, "User"] = TtlCache(cache_size, session_ttl)
+        self.cache_hits = 0
+        self.hashes = 0
+
+    def authenticate(self, username: str, password: str) -> Tuple[bool, Any]:
+        """То же, что SqliteStorage.authenticate_user, но с кешем; при промахе
+        хеширование идёт в пуле, а вызывающий поток только ждёт результат."""
+        return self.authenticate_async(username, password).result()
+
+    def authenticate_async(self, username: str, password: str) -> "Future[Tuple[bool, Any]]":
+        username = username.strip()
+        tag = self._tag(username, password)
+        cached = self._verified.get(username)
+        if cached is not None and hmac.compare_digest(cached[0], tag):
+            self.cache_hits += 1
+            future: "Future[Tuple[bool, Any]]" = Future()
+            future.set_result((True, cached[1]))
+            return future
+        return self._executor.submit(self._verify, username, password, tag)
+
+    def _verify(self, username: str, password: str, tag: bytes) -> Tuple[bool, Any]:
+        self.hashes += 1
+        ok, result = self.storage.authenticate_user(username, password)
+        if ok:
+            self._verified.put(username, (tag, result))
+        return ok, result
+
+    def register(self, username: str, password: str) -> Tuple[bool, str]:
+        return self._executor.submit(self.storage.register_user, username, password).result()
+
+    def forget(self, username: str) -> None:
+        """Сбрасывает кеш проверок пользователя (например, после смены пароля)."""
+        self._verified.pop(username.strip())
+
+    def _tag(self, username: str, password: str) -> bytes:
+        return hmac.new(self._secret, f"{username}\0{password}".encode("utf-8"), hashlib.sha256).digest()
+
+    # -------------------- Сессии --------------------
+
+    def login(self, username: str, password: str) -> Tuple[bool, Any]:
+        """Проверяет пароль и выдаёт токен сессии: (True, (User, токен))."""
+        ok, result = self.authenticate(username, password)
+        if not ok:
+            return ok, result
+        return True, (result, self.issue_token(result))
+
+    def issue_token(self, user: "User") -> str:
+        token = secrets.token_urlsafe(32)
+        self._sessions.put(token, user)
+        return token
+
+    def check_token(self, token: str) -> Optional["User"]:
+        """Пользователь сессии или None, если токен неизвестен или истёк."""
+        return self._sessions.get(token)
+
+    def revoke_token(self, token: str) -> None:
+        self._sessions.pop(token)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
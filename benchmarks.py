@@ -0,0 +1,257 @@
+"""Набор бенчмарков сортировки и слоя данных.
+
+В отличие от разовых замеров в integration_tests_lab3, каждый сценарий
+выполняется с прогревом и повторами; считаются перцентили, операции в
+секунду и пиковое потребление памяти (tracemalloc). Результаты пишутся в
+JSON и могут сравниваться с сохранённым эталоном:
+
+    python benchmarks.py --out bench.json
+    python benchmarks.py --baseline bench.json --threshold 0.15
+
+Код возврата 1 означает регрессию хотя бы одного сценария.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import tracemalloc
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+from auth import Authenticator
+from db_layer import SqliteStorage
+from sort_alg import adaptive_sort, quick_sort, sort_array
+
+SORT_ENGINES: Dict[str, Callable[[List[int]], Any]] = {
+    "quick_sort": quick_sort,
+    "adaptive_sort": adaptive_sort,
+    "sort_array": sort_array,
+    "builtin_sorted": sorted,
+}
+
+
+def _random(n: int, rng: random.Random) -> List[int]:
+    return [rng.randint(-(10**9), 10**9) for _ in range(n)]
+
+
+def _nearly_sorted(n: int, rng: random.Random) -> List[int]:
+    values = sorted(_random(n, rng))
+    for _ in range(max(1, n // 100)):
+        i, j = rng.randrange(n), rng.randrange(n)
+        values[i], values[j] = values[j], values[i]
+    return values
+
+
+DISTRIBUTIONS: Dict[str, Callable[[int, random.Random], List[int]]] = {
+    "random": _random,
+    "sorted": lambda n, rng: sorted(_random(n, rng)),
+    "reversed": lambda n, rng: sorted(_random(n, rng), reverse=True),
+    "nearly_sorted": _nearly_sorted,
+    "small_range": lambda n, rng: [rng.randint(-1000, 1000) for _ in range(n)],
+    "few_unique": lambda n, rng: [rng.choice((-7, 0, 3, 10**12)) for _ in range(n)],
+}
+
+
+@dataclass
+class BenchResult:
+    name: str
+    repeat: int
+    mean: float
+    p50: float
+    p95: float
+    p99: float
+    ops_per_sec: float
+    peak_memory: int
+
+
+def _percentile(sorted_samples: List[float], q: float) -> float:
+    if len(sorted_samples) == 1:
+        return sorted_samples[0]
+    pos = (len(sorted_samples) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_samples) - 1)
+    return sorted_samples[lo] + (sorted_samples[hi] - sorted_samples[lo]) * (pos - lo)
+
+
+def measure(
+    name: str,
+    fn: Callable[[], Any],
+    setup: Optional[Callable[[], None]] = None,
+    warmup: int = 1,
+    repeat: int = 5,
+) -> BenchResult:
+    """Замеряет fn: warmup прогонов без учёта, затем repeat замеров.
+
+    setup вызывается перед каждым прогоном и в замер не входит. Пиковая
+    память измеряется в отдельном прогоне, чтобы tracemalloc не искажал время.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+
+    samples: List[float] = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = perf_counter()
+        fn()
+        samples.append(perf_counter() - t0)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    samples.sort()
+    mean = statistics.mean(samples)
+    return BenchResult(
+        name=name,
+        repeat=repeat,
+        mean=mean,
+        p50=_percentile(samples, 0.50),
+        p95=_percentile(samples, 0.95),
+        p99=_percentile(samples, 0.99),
+        ops_per_sec=1.0 / mean if mean else 0.0,
+        peak_memory=peak,
+    )
+
+
+def bench_sorting(sizes: List[int], warmup: int, repeat: int, seed: int) -> List[BenchResult]:
+    results = []
+    for dist_name, gen in DISTRIBUTIONS.items():
+        for n in sizes:
+            data = gen(n, random.Random(seed))
+            for engine_name, engine in SORT_ENGINES.items():
+                results.append(
+                    measure(f"sort/{engine_name}/{dist_name}/{n}", lambda: engine(data), warmup=warmup, repeat=repeat)
+                )
+    return results
+
+
+def bench_storage(rows: List[int], warmup: int, repeat: int, seed: int) -> List[BenchResult]:
+    results = []
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SqliteStorage(os.path.join(tmp, "bench.db"))
+        auth = Authenticator(db)
+        try:
+            for n in rows:
+                payload = [[rng.randint(-1000, 1000) for _ in range(rng.randint(10, 120))] for _ in range(n)]
+
+                def fill() -> None:
+                    db.clear_all_arrays()
+                    db.insert_bulk_test_arrays(payload)
+
+                results += [
+                    measure(f"storage/insert_bulk/{n}", lambda: db.insert_bulk_test_arrays(payload),
+                            setup=db.clear_all_arrays, warmup=warmup, repeat=repeat),
+                    measure(f"storage/ingest/{n}", lambda: db.ingest_arrays(payload, batch_size=500),
+                            setup=db.clear_all_arrays, warmup=warmup, repeat=repeat),
+                    measure(f"storage/clear/{n}", db.clear_all_arrays, setup=fill, warmup=warmup, repeat=repeat),
+                ]
+
+                fill()
+                user_arrays = payload[:100]
+                results += [
+                    measure(f"storage/random_arrays_100/{n}", lambda: db.random_arrays(100),
+                            warmup=warmup, repeat=repeat),
+                    measure(f"storage/select_and_sort_100/{n}",
+                            lambda: [quick_sort(a) for a in db.random_arrays(100)], warmup=warmup, repeat=repeat),
+                    measure(f"storage/total_count/{n}", db.total_count, warmup=warmup, repeat=repeat),
+                    measure(f"storage/save_arrays_100/{n}",
+                            lambda: [db.save_arrays(1, a, None) for a in user_arrays], warmup=warmup, repeat=repeat),
+                    measure(f"storage/list_user_arrays/{n}", lambda: db.list_user_arrays(1, limit=100),
+                            warmup=warmup, repeat=repeat),
+                    measure(f"storage/authenticate_user/{n}", lambda: db.authenticate_user("bench", "bench"),
+                            setup=lambda: db.register_user("bench", "bench"), warmup=warmup, repeat=repeat),
+                    measure(f"storage/authenticate_cached/{n}", lambda: auth.authenticate("bench", "bench"),
+                            warmup=warmup, repeat=repeat),
+                ]
+        finally:
+            auth.close()
+            db.close()
+    return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Сценарии, у которых p50 вырос больше чем на threshold относительно эталона."""
+    base = {r["name"]: r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        b = base.get(r["name"])
+        if b is None or b["p50"] <= 0:
+            continue
+        change = r["p50"] / b["p50"] - 1.0
+        if change > threshold:
+            regressions.append(f"{r['name']}: p50 {b['p50']:.6f}s -> {r['p50']:.6f}s (+{change:.0%})")
+    return regressions
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    results: List[BenchResult] = []
+    if not args.storage_only:
+        results += bench_sorting(args.sizes, args.warmup, args.repeat, args.seed)
+    if not args.sort_only:
+        results += bench_storage(args.rows, args.warmup, args.repeat, args.seed)
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": [asdict(r) for r in results],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарки сортировки и SqliteStorage")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=12345)
+    parser.add_argument("--sort-only", action="store_true")
+    parser.add_argument("--storage-only", action="store_true")
+    parser.add_argument("--out", help="файл для результатов в JSON")
+    parser.add_argument("--baseline", help="JSON с эталонными результатами")
+    parser.add_argument("--threshold", type=float, default=0.10, help="допустимый рост p50 (доля)")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    for r in report["results"]:
+        print(
+            f"{r['name']:<48} p50={r['p50']:.6f}s p95={r['p95']:.6f}s p99={r['p99']:.6f}s "
+            f"ops/s={r['ops_per_sec']:.1f} peak={r['peak_memory'] / 1024:.0f}KiB"
+        )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print("\nРЕГРЕССИИ:")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print("\nРегрессий нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""Файл данных для больших массивов с доступом через mmap.
+
+Массивы дописываются в конец файла как little-endian int64 (append-only),
+а в SQLite хранятся только смещение и длина (array_codec.encode_extern).
+Чтение возвращает memoryview или массив NumPy прямо поверх отображения
+файла в память, поэтому не зависит от размера массива.
+
+Место, занятое удалёнными массивами, освобождает compact(): живые отрезки
+переписываются в новый файл, а старый остаётся текущим, пока вызывающий не
+зафиксирует новые смещения у себя (в БД) и не переключится на новый файл
+через switch(). Так сбой между этими шагами не оставляет ссылок на смещения
+не того файла. Уже выданные представления продолжают ссылаться на старое
+отображение и остаются корректными.
+
+Массив дописывается в фактический конец файла под блокировкой файла
+(fcntl.flock, где она есть), а не по размеру, запомненному при открытии,
+поэтому в один файл могут писать несколько экземпляров и процессов.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import sys
+import threading
+from array import array
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:  # NumPy необязателен
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+try:  # блокировка файлов есть только в POSIX
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+ITEM_SIZE = 8
+_COPY_BLOCK = 1 << 20  # элементов за одну операцию при сжатии
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+class MmapBlobStore:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._file: Optional[BinaryIO] = None
+        self._size = os.path.getsize(path) if os.path.exists(path) else 0
+        self._dirty = False
+        self._map: Optional[mmap.mmap] = None
+        # Отображения, которые заменили новыми (файл вырос или был сжат).
+        # Их не закрываем: на них могут ссылаться выданные представления.
+        self._old_maps: List[mmap.mmap] = []
+
+    @property
+    def size(self) -> int:
+        """Размер файла данных в байтах."""
+        return self._size
+
+    def append(self, values: Sequence[int]) -> Tuple[int, int]:
+        """Дописывает массив в конец файла и возвращает (смещение, длина).
+
+        Значения должны помещаться в int64 (иначе OverflowError).
+        """
+        packed = values if isinstance(values, array) and values.typecode == "q" else array("q", values)
+        if _BIG_ENDIAN:
+            packed = array("q", packed)
+            packed.byteswap()
+        with self._lock:
+            f = self._writer()
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                offset = f.seek(0, os.SEEK_END)
+                packed.tofile(f)
+                f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            self._size = max(self._size, offset + len(packed) * ITEM_SIZE)
+            self._dirty = True
+        return offset, len(packed)
+
+    def sync(self) -> None:
+        """Сбрасывает дописанные данные на диск (вызывается перед коммитом)."""
+        with self._lock:
+            if self._dirty and self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._dirty = False
+
+    def view(self, offset: int, count: int, kind: str = "memoryview") -> Any:
+        """Массив из count элементов по смещению offset без копирования.
+
+        kind: "memoryview" (формат "q"), "numpy" (только для чтения), "array"
+        или "list" - два последних копируют данные.
+        """
+        end = offset + count * ITEM_SIZE
+        mapped = self._mapped(end)
+        if kind == "numpy" and np is not None:
+            return np.frombuffer(mapped, dtype="<i8", count=count, offset=offset).astype(np.int64, copy=False)
+        buf = memoryview(mapped)[offset:end]
+        if _BIG_ENDIAN:
+            values = array("q", buf.tobytes())
+            values.byteswap()
+            buf = memoryview(values)
+        else:
+            buf = buf.cast("q")
+        if kind == "list":
+            return buf.tolist()
+        if kind == "array":
+            return array("q", buf)
+        return buf
+
+    def _mapped(self, end: int) -> mmap.mmap:
+        with self._lock:
+            if end > self._size:
+                # Файл мог дописать другой экземпляр или процесс.
+                self._size = os.path.getsize(self.path)
+            if end > self._size:
+                raise ValueError("Отрезок выходит за пределы файла данных")
+            if self._map is None or len(self._map) < end:
+                if self._file is not None:
+                    self._file.flush()
+                if self._map is not None:
+                    self._old_maps.append(self._map)
+                with open(self.path, "rb") as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._map
+
+    def compact(self, segments: Iterable[Tuple[int, int]], new_path: str) -> Dict[int, int]:
+        """Переписывает в файл new_path только перечисленные отрезки (смещение, длина).
+
+        Возвращает соответствие старых смещений новым. Текущим остаётся
+        прежний файл: переключиться на новый нужно через switch() после того,
+        как ссылки на новые смещения зафиксированы.
+        """
+        live = sorted(set((int(o), int(c)) for o, c in segments))
+        moved: Dict[int, int] = {}
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            with open(self.path, "ab+") as src, open(new_path, "wb") as dst:
+                for offset, count in live:
+                    moved[offset] = dst.tell()
+                    src.seek(offset)
+                    remaining = count * ITEM_SIZE
+                    while remaining:
+                        chunk = src.read(min(remaining, _COPY_BLOCK * ITEM_SIZE))
+                        if not chunk:
+                            raise ValueError("Отрезок выходит за пределы файла данных")
+                        dst.write(chunk)
+                        remaining -= len(chunk)
+                dst.flush()
+                os.fsync(dst.fileno())
+        return moved
+
+    def switch(self, path: str) -> None:
+        """Делает path текущим файлом данных и удаляет прежний."""
+        with self._lock:
+            old_path = self.path
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._map is not None:
+                self._old_maps.append(self._map)
+                self._map = None
+            self.path = path
+            self._size = os.path.getsize(path) if os.path.exists(path) else 0
+            self._dirty = False
+        if old_path != path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass  # нет файла или он ещё отображён (Windows) - уберёт владелец при следующем открытии
+
+    def _writer(self) -> BinaryIO:
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        return self._file
+
+    def close(self) -> None:
+        """Закрывает файл и отображения; при следующем обращении они откроются заново."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            maps, self._old_maps = self._old_maps, []
+            if self._map is not None:
+                maps.append(self._map)
+                self._map = None
+        for m in maps:
+            try:
+                m.close()
+            except BufferError:
+                pass  # на отображение ещё ссылаются выданные представления
@@ -6,14 +6,112 @@
 
 from __future__ import annotations
 
-import hashlib
-import json
 import os
+import random
 import sqlite3
+import threading
+import weakref
 from contextlib import contextmanager
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from time import perf_counter, sleep
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from array_codec import (
+    ARRAY_KINDS,
+    FMT_EXTERN,
+    FMT_PATCH,
+    FMT_REF,
+    content_hash,
+    decode_array,
+    decode_prefix,
+    encode_array,
+    encode_extern,
+    encode_ref,
+    extern_location,
+    prefix_size,
+    ref_digest,
+    to_kind,
+)
+from array_delta import ArrayDelta
+from array_io import PathLike, iter_arrays_file
+from auth import hash_password, verify_dummy, verify_password
+from blob_store import MmapBlobStore
+from metrics import instrument
+from sort_alg import sort_array
+
+# Версия схемы хранится в PRAGMA user_version.
+# 1 - массивы в JSON (original_json/sorted_json), 2 - двоичный формат array_codec,
+# 3 - индекс arrays(user_id, id) для постраничной истории,
+# 4 - таблица contents: содержимое массивов, адресуемое хешем (дедупликация),
+# 5 - столбец arrays.parent_id для записей, сохранённых правкой (FMT_PATCH),
+# 6 - таблица array_stats со счётчиками, которые ведут триггеры на arrays,
+# 7 - таблица storage_meta (текущее поколение файла данных),
+# 8 - счётчик ссылок contents.refs, который ведут триггеры на arrays.
+SCHEMA_VERSION = 8
+
+# Размер пачки id в запросах "WHERE id IN (...)" и число раундов случайной
+# выборки до перехода на выборку из списка подходящих id.
+_SAMPLE_BATCH = 500
+_SAMPLE_ROUNDS = 8
+
+# Наибольшая длина цепочки правок: при чтении каждая правка применяется к
+# родителю, поэтому более длинные цепочки сохраняются полной копией.
+MAX_DELTA_CHAIN = 8
+
+# Границы гистограммы длин в array_stats (те же, что metrics.SIZE_BUCKETS):
+# корзина i - массивы длиной не больше LENGTH_BUCKETS[i], последняя - длиннее.
+LENGTH_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+# user_id строк array_stats с итогами по всем пользователям.
+STATS_ALL_USERS = -1
+
+
+def _length_bucket_sql(column: str) -> str:
+    cases = " ".join(f"WHEN {column} <= {bound} THEN {i}" for i, bound in enumerate(LENGTH_BUCKETS))
+    return f"CASE {cases} ELSE {len(LENGTH_BUCKETS)} END"
+
+
+def _stats_upsert_sql(row: str, sign: str) -> str:
+    bucket = _length_bucket_sql(f"{row}.length")
+    return f"""
+        INSERT INTO array_stats(user_id, bucket, arrays, elements)
+        VALUES ({row}.user_id, {bucket}, {sign}1, {sign}{row}.length),
+               ({STATS_ALL_USERS}, {bucket}, {sign}1, {sign}{row}.length)
+        ON CONFLICT(user_id, bucket) DO UPDATE SET
+            arrays = arrays + excluded.arrays,
+            elements = elements + excluded.elements;
+    """
+
+
+def _is_ref_sql(row: str) -> str:
+    return f"substr({row}.original_data, 1, 1) = x'{FMT_REF:02x}'"
+
+
+def _refs_add_sql(row: str, sign: str) -> str:
+    return f"""
+        UPDATE contents SET refs = refs {sign} 1
+        WHERE {_is_ref_sql(row)} AND hash = substr({row}.original_data, 2);
+    """
+
+
+def _refs_release_sql(row: str) -> str:
+    return f"""
+        DELETE FROM contents
+        WHERE {_is_ref_sql(row)} AND hash = substr({row}.original_data, 2) AND refs <= 0;
+    """
+
+# Настройки, применяемые к каждому соединению.
+# WAL позволяет читателям не блокировать писателя, synchronous=NORMAL в режиме
+# WAL сохраняет целостность БД и не делает fsync на каждый коммит.
+CONNECTION_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -16000,  # ~16 МБ кеша страниц
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
 
 
 @dataclass(frozen=True)
@@ -22,24 +120,228 @@ class User:
     username: str
 
 
+@dataclass
+class IngestStats:
+    arrays: int = 0
+    elements: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def arrays_per_sec(self) -> float:
+        return self.arrays / self.seconds if self.seconds else 0.0
+
+    @property
+    def elements_per_sec(self) -> float:
+        return self.elements / self.seconds if self.seconds else 0.0
+
+
+def _generation_path(data_file: str, generation: int) -> str:
+    # Поколение 0 - сам data_file (файлы, созданные до появления поколений).
+    return data_file if generation == 0 else f"{data_file}.{generation}"
+
+
+def is_busy_error(error: BaseException) -> bool:
+    """Ошибка конкурентного доступа ("database is locked"/"busy"): операцию
+    можно повторить позже."""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+class _ThreadConnections:
+    """Соединения одного потока (значение threading.local)."""
+
+    __slots__ = ("writer", "reader", "__weakref__")
+
+    def __init__(self) -> None:
+        self.writer: Optional[sqlite3.Connection] = None
+        self.reader: Optional[sqlite3.Connection] = None
+
+
+def _release_connection(
+    connections: List[sqlite3.Connection], lock: threading.Lock, conn: sqlite3.Connection
+) -> None:
+    with lock:
+        if not any(c is conn for c in connections):
+            return  # уже закрыто в SqliteStorage.close()
+        connections.remove(conn)
+    conn.close()
+
+
 class SqliteStorage:
-    def __init__(self, db_path: str):
+    def __init__(
+        self,
+        db_path: str,
+        array_kind: str = "list",
+        delta_sorted: bool = False,
+        dedup: bool = False,
+        data_file: Optional[str] = None,
+        extern_min_bytes: int = 64 * 1024,
+    ):
+        """array_kind - тип возвращаемых массивов ("list", "array", "numpy"
+        или "memoryview"),
+        delta_sorted - хранить отсортированные массивы в разностном формате,
+        dedup - сохранять массивы в таблицу contents по хешу содержимого, а в
+        arrays записывать только ссылку (одинаковые массивы хранятся один раз),
+        data_file - файл данных (MmapBlobStore) для массивов от
+        extern_min_bytes байт: в БД остаются смещение и длина, а чтение с
+        array_kind "numpy"/"memoryview" не копирует данные.
+        """
+        if array_kind not in ARRAY_KINDS:
+            raise ValueError(f"array_kind должен быть одним из {ARRAY_KINDS}")
         self.db_path = db_path
+        self.array_kind = array_kind
+        self.delta_sorted = delta_sorted
+        self.dedup = dedup
+        self.extern_min_bytes = extern_min_bytes
+        self.data_file = data_file
+        self._blobs: Optional[MmapBlobStore] = None
         os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # Каждый поток держит собственные постоянные соединения: одно на запись
+        # и одно только для чтения. Все открытые соединения учитываются в
+        # _connections, чтобы close() мог их закрыть; соединения завершившегося
+        # потока закрываются сами (см. _thread_conn).
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
         self._init_schema()
+        if data_file:
+            self._open_blobs()
+
+    def _open(self, read_only: bool) -> sqlite3.Connection:
+        if read_only:
+            uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            # Действует только для новой (пустой) БД и должно идти до WAL:
+            # освобождённые страницы можно вернуть reclaim_space() без VACUUM.
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        for name, value in CONNECTION_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _thread_conn(self, read_only: bool) -> sqlite3.Connection:
+        if self.db_path == ":memory:":
+            # У каждой in-memory БД своё содержимое - читаем через соединение записи.
+            read_only = False
+        slot = getattr(self._local, "slot", None)
+        if slot is None:
+            slot = self._local.slot = _ThreadConnections()
+        attr = "reader" if read_only else "writer"
+        conn = getattr(slot, attr)
+        if conn is None:
+            conn = self._open(read_only)
+            setattr(slot, attr, conn)
+            # threading.local освобождает значения вместе с потоком - тогда же
+            # закрываем его соединения, иначе каждый короткоживущий поток
+            # оставлял бы открытое соединение до close().
+            weakref.finalize(slot, _release_connection, self._connections, self._connections_lock, conn)
+        return conn
 
     @contextmanager
     def _connect(self) -> Iterable[sqlite3.Connection]:
-        conn = sqlite3.connect(self.db_path)
+        """Соединение на запись: коммит при успехе, откат при ошибке.
+
+        Если используется файл данных, блокировка записи берётся сразу
+        (BEGIN IMMEDIATE): массивы дописываются в файл в том же порядке, в
+        котором фиксируются транзакции, а поколение файла сверяется с БД -
+        его могло сменить сжатие в другом экземпляре или процессе.
+        """
+        conn = self._thread_conn(read_only=False)
         try:
-            conn.row_factory = sqlite3.Row
+            if self._blobs is not None:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                path = _generation_path(self.data_file, self._data_generation(conn))
+                if path != self._blobs.path:
+                    self._blobs.switch(path)
             yield conn
+            if self._blobs is not None:
+                # Данные, на которые ссылается транзакция, должны попасть
+                # на диск раньше неё.
+                self._blobs.sync()
             conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    @contextmanager
+    def _read(self) -> Iterable[sqlite3.Connection]:
+        """Соединение только для чтения.
+
+        Запросы блока выполняются в одной читающей транзакции и видят один
+        снимок БД: запись arrays и содержимое contents, на которое она
+        ссылается, не разойдутся, даже если между запросами их удалит
+        purge_arrays() в другом потоке.
+        """
+        conn = self._thread_conn(read_only=True)
+        if conn.in_transaction:
+            yield conn  # вложенный блок - внутри уже открытой транзакции
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
         finally:
+            conn.rollback()
+
+    def set_busy_timeout(self, seconds: float) -> None:
+        """Время ожидания занятой БД для соединения записи текущего потока
+        (по умолчанию - CONNECTION_PRAGMAS). Малое значение отдаёт ожидание
+        блокировки вызывающему коду, например циклу повторов WriteBehindQueue."""
+        self._thread_conn(read_only=False).execute(f"PRAGMA busy_timeout={int(seconds * 1000)}")
+
+    def close(self) -> None:
+        """Закрывает все соединения, открытые этим хранилищем."""
+        with self._connections_lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
             conn.close()
+        self._local = threading.local()
+        if self._blobs is not None:
+            self._blobs.close()
+
+    def _open_blobs(self) -> None:
+        """Открывает поколение файла данных, записанное в БД, и удаляет
+        остальные (их оставило сжатие, прерванное до или после коммита).
+
+        Под блокировкой записи: сжатие в другом экземпляре держит её, пока
+        пишет файл следующего поколения, и этот файл не будет удалён."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            path = _generation_path(self.data_file, self._data_generation(conn))
+            directory, base = os.path.split(self.data_file)
+            for name in os.listdir(directory or "."):
+                suffix = name[len(base) + 1 :] if name.startswith(base + ".") else None
+                stale = (suffix is not None and suffix.isdigit()) or name == base
+                if stale and os.path.join(directory, name) != path:
+                    os.remove(os.path.join(directory, name))
+            self._blobs = MmapBlobStore(path)
+
+    @staticmethod
+    def _data_generation(conn: sqlite3.Connection) -> int:
+        row = conn.execute("SELECT value FROM storage_meta WHERE key='data_generation'").fetchone()
+        return int(row[0]) if row is not None else 0
 
     def _init_schema(self) -> None:
         with self._connect() as conn:
+            # Схема уже текущей версии (обычный запуск) - DDL не нужен.
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version == SCHEMA_VERSION:
+                return
+            # DDL в SQLite транзакционен: вся миграция, включая user_version,
+            # - одна транзакция, и прерванное обновление откатывается целиком.
+            # Версию перечитываем под блокировкой: её мог обновить другой процесс.
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version == SCHEMA_VERSION:
+                return
             conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS users (
@@ -50,25 +352,299 @@ class SqliteStorage:
                 );
                 """
             )
+            has_arrays = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='arrays'"
+            ).fetchone()
+            has_contents = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='contents'"
+            ).fetchone()
+            if has_arrays and version < 2:
+                self._migrate_to_v2(conn)
+            if has_arrays and version < 5:
+                conn.execute("ALTER TABLE arrays ADD COLUMN parent_id INTEGER REFERENCES arrays(id)")
+            self._create_array_tables(conn)
+            if has_contents and version < 8:
+                conn.execute("ALTER TABLE contents ADD COLUMN refs INTEGER NOT NULL DEFAULT 0")
+            self._create_stats(conn)
+            self._create_content_refs(conn)
+            if has_arrays and version < 6:
+                self._rebuild_stats(conn)
+            if has_contents and version < 8:
+                self._rebuild_content_refs(conn)
             conn.execute(
                 """
-                CREATE TABLE IF NOT EXISTS arrays (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    original_json TEXT NOT NULL,
-                    sorted_json TEXT,
-                    length INTEGER NOT NULL,
-                    created_at TEXT NOT NULL,
-                    FOREIGN KEY(user_id) REFERENCES users(id)
-                );
+                CREATE TABLE IF NOT EXISTS storage_meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                ) WITHOUT ROWID;
                 """
             )
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @staticmethod
+    def _create_array_tables(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS arrays (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                original_data BLOB NOT NULL,
+                sorted_data BLOB,
+                length INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                parent_id INTEGER REFERENCES arrays(id),
+                FOREIGN KEY(user_id) REFERENCES users(id)
+            );
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_arrays_user_id ON arrays(user_id, id)")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS contents (
+                hash BLOB PRIMARY KEY,
+                original_data BLOB NOT NULL,
+                sorted_data BLOB,
+                length INTEGER NOT NULL,
+                refs INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID;
+            """
+        )
 
     @staticmethod
-    def _hash_password(password: str) -> str:
-        # SHA-256 достаточно для учебной работы; в реальных системах используют соль и адаптивные хеши.
-        return hashlib.sha256(password.encode("utf-8")).hexdigest()
+    def _create_stats(conn: sqlite3.Connection) -> None:
+        # Счётчики обновляются триггерами в той же транзакции, что и arrays,
+        # поэтому их учитывают все пути записи, включая ручные запросы.
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS array_stats (
+                user_id INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                arrays INTEGER NOT NULL,
+                elements INTEGER NOT NULL,
+                PRIMARY KEY(user_id, bucket)
+            ) WITHOUT ROWID;
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS arrays_stats_insert AFTER INSERT ON arrays BEGIN
+                {_stats_upsert_sql("NEW", "")}
+            END;
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS arrays_stats_delete AFTER DELETE ON arrays BEGIN
+                {_stats_upsert_sql("OLD", "-")}
+            END;
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS arrays_stats_update AFTER UPDATE OF user_id, length ON arrays BEGIN
+                {_stats_upsert_sql("OLD", "-")}
+                {_stats_upsert_sql("NEW", "")}
+            END;
+            """
+        )
 
+    @staticmethod
+    def _create_content_refs(conn: sqlite3.Connection) -> None:
+        # contents.refs - число записей arrays со ссылкой FMT_REF на строку
+        # (sorted_data ссылается на тот же хеш, что и original_data). Строка,
+        # на которую не осталось ссылок, удаляется в той же транзакции.
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS contents_refs_insert AFTER INSERT ON arrays
+            WHEN {_is_ref_sql("NEW")} BEGIN
+                {_refs_add_sql("NEW", "+")}
+            END;
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS contents_refs_delete AFTER DELETE ON arrays
+            WHEN {_is_ref_sql("OLD")} BEGIN
+                {_refs_add_sql("OLD", "-")}
+                {_refs_release_sql("OLD")}
+            END;
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS contents_refs_update AFTER UPDATE OF original_data ON arrays
+            WHEN OLD.original_data IS NOT NEW.original_data
+                AND ({_is_ref_sql("OLD")} OR {_is_ref_sql("NEW")}) BEGIN
+                {_refs_add_sql("NEW", "+")}
+                {_refs_add_sql("OLD", "-")}
+                {_refs_release_sql("OLD")}
+            END;
+            """
+        )
+
+    @staticmethod
+    def _rebuild_content_refs(conn: sqlite3.Connection) -> None:
+        # Один просмотр arrays; строки без ссылок (в том числе записанные
+        # прежним кэшем сортировки) удаляются.
+        rows = conn.execute(
+            f"""
+            SELECT COUNT(*), substr(original_data, 2) FROM arrays
+            WHERE {_is_ref_sql("arrays")} GROUP BY 2
+            """
+        ).fetchall()
+        conn.execute("UPDATE contents SET refs=0")
+        conn.executemany("UPDATE contents SET refs=? WHERE hash=?", [tuple(r) for r in rows])
+        conn.execute("DELETE FROM contents WHERE refs<=0")
+
+    @staticmethod
+    def _rebuild_stats(conn: sqlite3.Connection) -> None:
+        bucket = _length_bucket_sql("length")
+        conn.execute("DELETE FROM array_stats")
+        conn.execute(
+            f"""
+            INSERT INTO array_stats(user_id, bucket, arrays, elements)
+            SELECT user_id, {bucket}, COUNT(*), SUM(length) FROM arrays GROUP BY 1, 2
+            """
+        )
+        conn.execute(
+            f"""
+            INSERT INTO array_stats(user_id, bucket, arrays, elements)
+            SELECT {STATS_ALL_USERS}, {bucket}, COUNT(*), SUM(length) FROM arrays GROUP BY 2
+            """
+        )
+
+    @staticmethod
+    def _migrate_to_v2(conn: sqlite3.Connection) -> None:
+        # Переименование столбцов меняет только схему и выполняется мгновенно.
+        # Старые строки остаются JSON-текстом (decode_array их понимает)
+        # и переводятся в двоичный формат постепенно: migrate_json_rows().
+        conn.execute("ALTER TABLE arrays RENAME COLUMN original_json TO original_data")
+        conn.execute("ALTER TABLE arrays RENAME COLUMN sorted_json TO sorted_data")
+
+    @instrument("storage.migrate_json_rows", rows=lambda r: r)
+    def migrate_json_rows(self, batch_size: int = 500) -> int:
+        """Переводит строки из JSON в двоичный формат порциями.
+
+        Каждая порция - отдельная транзакция, поэтому блокировка на запись
+        удерживается недолго и миграцию можно выполнять на работающей БД.
+        Возвращает количество преобразованных строк.
+        """
+        converted = 0
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    """
+                    SELECT id, original_data, sorted_data FROM arrays
+                    WHERE typeof(original_data) = 'text' OR typeof(sorted_data) = 'text'
+                    LIMIT ?
+                    """,
+                    (int(batch_size),),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE arrays SET original_data=?, sorted_data=? WHERE id=?",
+                    [
+                        (
+                            self._encode_original(decode_array(r["original_data"])),
+                            self._encode_sorted(decode_array(r["sorted_data"]) if r["sorted_data"] else None),
+                            int(r["id"]),
+                        )
+                        for r in rows
+                    ],
+                )
+            converted += len(rows)
+            if len(rows) < batch_size:
+                return converted
+
+    def _encode_original(self, values: Sequence[int]) -> bytes:
+        return self._encode_extern(values) or encode_array(values)
+
+    def _encode_sorted(self, values: Optional[Sequence[int]]) -> Optional[bytes]:
+        if values is None:
+            return None
+        return self._encode_extern(values) or encode_array(values, delta=self.delta_sorted)
+
+    def _encode_extern(self, values: Sequence[int]) -> Optional[bytes]:
+        """Дописывает большой массив в файл данных и возвращает ссылку на него.
+
+        Вызывается только внутри _connect(), то есть под блокировкой записи
+        БД. Если транзакция, сохраняющая ссылку, откатится, записанные данные
+        останутся неиспользуемыми до compact_data_file().
+        """
+        if self._blobs is None or len(values) * 8 < self.extern_min_bytes:
+            return None
+        try:
+            return encode_extern(*self._blobs.append(values))
+        except OverflowError:
+            return None  # значения вне int64 - в БД как FMT_BIGINT
+
+    def _decode(
+        self,
+        conn: sqlite3.Connection,
+        payload: Any,
+        column: str = "original_data",
+        parent_id: Optional[int] = None,
+        kind: Optional[str] = None,
+    ) -> Any:
+        kind = kind or self.array_kind
+        digest = ref_digest(payload)
+        if digest is not None:
+            row = conn.execute(f"SELECT {column} FROM contents WHERE hash=?", (digest,)).fetchone()
+            if row is None or row[0] is None:
+                raise LookupError("Содержимое массива не найдено в contents")
+            payload = row[0]
+        if isinstance(payload, bytes) and payload[:1] == bytes((FMT_PATCH,)):
+            return to_kind(self._apply_patch(conn, payload, column, parent_id), kind)
+        return self._decode_payload(payload, kind)
+
+    def _decode_payload(self, payload: Any, kind: Optional[str] = None) -> Any:
+        kind = kind or self.array_kind
+        location = extern_location(payload)
+        if location is not None:
+            if self._blobs is None:
+                raise LookupError("Массив хранится в файле данных, но data_file не задан")
+            return self._blobs.view(*location, kind=kind)
+        return decode_array(payload, kind)
+
+    def _apply_patch(self, conn: sqlite3.Connection, payload: bytes, column: str, parent_id: Optional[int]) -> List[int]:
+        parent = self._load_values(conn, parent_id, column)
+        delta = ArrayDelta.decode(payload)
+        return delta.apply_sorted(parent) if column == "sorted_data" else delta.apply(parent)
+
+    def _load_values(self, conn: sqlite3.Connection, array_id: Optional[int], column: str) -> List[int]:
+        row = conn.execute(f"SELECT {column}, parent_id FROM arrays WHERE id=?", (array_id,)).fetchone()
+        if row is None or row[0] is None:
+            raise LookupError("Исходная запись правки не найдена")
+        return self._decode(conn, row[0], column, row[1], kind="list")
+
+    def _put_content(
+        self,
+        conn: sqlite3.Connection,
+        digest: bytes,
+        original: Sequence[int],
+        sorted_values: Optional[Sequence[int]],
+    ) -> None:
+        row = conn.execute("SELECT sorted_data IS NOT NULL FROM contents WHERE hash=?", (digest,)).fetchone()
+        if row is None:
+            conn.execute(
+                "INSERT INTO contents(hash, original_data, sorted_data, length) VALUES(?, ?, ?, ?)",
+                (digest, self._encode_original(original), self._encode_sorted(sorted_values), len(original)),
+            )
+        elif not row[0] and sorted_values is not None:
+            conn.execute(
+                "UPDATE contents SET sorted_data=? WHERE hash=?",
+                (self._encode_sorted(sorted_values), digest),
+            )
+
+    def lookup_sorted(self, digest: bytes) -> Optional[Any]:
+        """Отсортированный массив по хешу исходного или None (находятся
+        только сохранённые массивы, см. sort_cache)."""
+        with self._read() as conn:
+            row = conn.execute("SELECT sorted_data FROM contents WHERE hash=?", (digest,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return self._decode_payload(row[0])
+
+    @instrument("storage.register_user")
     def register_user(self, username: str, password: str) -> Tuple[bool, str]:
         username = username.strip()
         if len(username) < 3:
@@ -76,7 +652,7 @@ class SqliteStorage:
         if len(password) < 4:
             return False, "Пароль должен быть не короче 4 символов"
 
-        pwd_hash = self._hash_password(password)
+        pwd_hash = hash_password(password)
         try:
             with self._connect() as conn:
                 conn.execute(
@@ -89,82 +665,321 @@ class SqliteStorage:
         except Exception as e:
             return False, f"Ошибка регистрации: {e}"
 
+    @instrument("storage.authenticate_user")
     def authenticate_user(self, username: str, password: str) -> Tuple[bool, Any]:
-        pwd_hash = self._hash_password(password)
+        """Проверяет пароль (см. auth). Хеш в устаревшем формате после
+        успешного входа заменяется новым. Для повторных проверок с кешем и
+        пулом хеширования используйте auth.Authenticator.
+        """
         try:
-            with self._connect() as conn:
+            with self._read() as conn:
                 row = conn.execute(
-                    "SELECT id, username FROM users WHERE username=? AND password_hash=?",
-                    (username.strip(), pwd_hash),
+                    "SELECT id, username, password_hash FROM users WHERE username=?",
+                    (username.strip(),),
                 ).fetchone()
-            if row:
-                return True, User(id=int(row["id"]), username=str(row["username"]))
-            return False, "Неверный логин или пароль"
+            if row is None:
+                verify_dummy(password)
+                return False, "Неверный логин или пароль"
+            ok, outdated = verify_password(password, str(row["password_hash"]))
+            if not ok:
+                return False, "Неверный логин или пароль"
+            if outdated:
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE users SET password_hash=? WHERE id=? AND password_hash=?",
+                        (hash_password(password), int(row["id"]), row["password_hash"]),
+                    )
+            return True, User(id=int(row["id"]), username=str(row["username"]))
         except Exception as e:
             return False, f"Ошибка подключения/запроса: {e}"
 
+    @instrument("storage.save_arrays", array_arg="original", rows=lambda r: 1)
     def save_arrays(
         self,
         user_id: int,
-        original: List[int],
-        sorted_values: Optional[List[int]],
+        original: Sequence[int],
+        sorted_values: Optional[Sequence[int]],
     ) -> Tuple[bool, str]:
         try:
             with self._connect() as conn:
-                conn.execute(
-                    """
-                    INSERT INTO arrays(user_id, original_json, sorted_json, length, created_at)
-                    VALUES(?, ?, ?, ?, ?)
-                    """,
-                    (
-                        int(user_id),
-                        json.dumps(original, ensure_ascii=False),
-                        json.dumps(sorted_values, ensure_ascii=False) if sorted_values is not None else None,
-                        len(original),
-                        datetime.now().isoformat(timespec="seconds"),
-                    ),
-                )
+                self._insert_array(conn, user_id, original, sorted_values)
             return True, "Данные сохранены"
         except Exception as e:
             return False, f"Ошибка сохранения: {e}"
 
-    def list_user_arrays(self, user_id: int) -> Tuple[bool, Any]:
+    @instrument("storage.save_arrays_many", rows=len)
+    def save_arrays_many(
+        self,
+        items: Iterable[Tuple[int, Sequence[int], Optional[Sequence[int]]]],
+    ) -> List[Tuple[bool, str]]:
+        """Групповое сохранение: все элементы (user_id, original, sorted_values)
+        записываются одной транзакцией с одним коммитом.
+
+        Ошибка в отдельном элементе откатывает только его (SAVEPOINT);
+        результат - список (ok, сообщение) в порядке элементов.
+        """
+        items = list(items)
+        try:
+            return self.save_arrays_batch(items)
+        except Exception as e:
+            # Транзакция не зафиксирована - не сохранён ни один элемент.
+            return [(False, f"Ошибка сохранения: {e}")] * len(items)
+
+    def save_arrays_batch(
+        self,
+        items: Sequence[Tuple[int, Sequence[int], Optional[Sequence[int]]]],
+    ) -> List[Tuple[bool, str]]:
+        """То же, что save_arrays_many, но ошибки уровня транзакции (например,
+        "database is locked") не перехватываются - их обрабатывает вызывающий.
+
+        Блокировка записи берётся сразу (BEGIN IMMEDIATE): если БД занята,
+        ошибка возникает до записи первого элемента, а не после ожидания
+        busy_timeout на каждом из них.
+        """
+        results: List[Tuple[bool, str]] = []
+        with self._connect() as conn:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            for user_id, original, sorted_values in items:
+                conn.execute("SAVEPOINT save_item")
+                try:
+                    self._insert_array(conn, user_id, original, sorted_values)
+                except Exception as e:
+                    if is_busy_error(e):
+                        raise  # ошибка всей транзакции, а не элемента
+                    conn.execute("ROLLBACK TO save_item")
+                    results.append((False, f"Ошибка сохранения: {e}"))
+                else:
+                    results.append((True, "Данные сохранены"))
+                conn.execute("RELEASE save_item")
+        return results
+
+    def _insert_array(
+        self,
+        conn: sqlite3.Connection,
+        user_id: int,
+        original: Sequence[int],
+        sorted_values: Optional[Sequence[int]],
+    ) -> None:
+        if self.dedup:
+            digest = content_hash(original)
+            self._put_content(conn, digest, original, sorted_values)
+            original_data = encode_ref(digest)
+            sorted_data = encode_ref(digest) if sorted_values is not None else None
+        else:
+            original_data = self._encode_original(original)
+            sorted_data = self._encode_sorted(sorted_values)
+        conn.execute(
+            """
+            INSERT INTO arrays(user_id, original_data, sorted_data, length, created_at)
+            VALUES(?, ?, ?, ?, ?)
+            """,
+            (
+                int(user_id),
+                original_data,
+                sorted_data,
+                len(original),
+                datetime.now().isoformat(timespec="seconds"),
+            ),
+        )
+
+    @instrument("storage.save_array_delta", rows=lambda r: 1)
+    def save_array_delta(
+        self,
+        user_id: int,
+        parent_id: int,
+        delta: ArrayDelta,
+        with_sorted: bool = True,
+    ) -> Tuple[bool, str]:
+        """Сохраняет правку записи parent_id (см. array_delta) как новую запись.
+
+        В arrays записывается только правка со ссылкой на родителя - O(k)
+        вместо полной копии; массивы восстанавливаются из родителя при чтении.
+        При with_sorted сохраняется и отсортированный массив: он получается
+        из отсортированного массива родителя. Если цепочка правок достигла
+        MAX_DELTA_CHAIN, новая запись сохраняется полной копией.
+        """
         try:
             with self._connect() as conn:
-                rows = conn.execute(
+                row = conn.execute(
+                    "SELECT sorted_data IS NOT NULL FROM arrays WHERE id=? AND user_id=?",
+                    (int(parent_id), int(user_id)),
+                ).fetchone()
+                if row is None:
+                    return False, "Исходная запись не найдена"
+                if with_sorted and not row[0]:
+                    return False, "У исходной записи нет отсортированного массива"
+
+                if self._chain_length(conn, int(parent_id)) >= MAX_DELTA_CHAIN:
+                    original = delta.apply(self._load_values(conn, int(parent_id), "original_data"))
+                    sorted_values = None
+                    if with_sorted:
+                        sorted_values = delta.apply_sorted(self._load_values(conn, int(parent_id), "sorted_data"))
+                    self._insert_array(conn, user_id, original, sorted_values)
+                else:
+                    patch = delta.encode()
+                    conn.execute(
+                        """
+                        INSERT INTO arrays(user_id, original_data, sorted_data, length, created_at, parent_id)
+                        VALUES(?, ?, ?, ?, ?, ?)
+                        """,
+                        (
+                            int(user_id),
+                            patch,
+                            patch if with_sorted else None,
+                            delta.length,
+                            datetime.now().isoformat(timespec="seconds"),
+                            int(parent_id),
+                        ),
+                    )
+            return True, "Данные сохранены"
+        except Exception as e:
+            return False, f"Ошибка сохранения: {e}"
+
+    @staticmethod
+    def _chain_length(conn: sqlite3.Connection, array_id: int) -> int:
+        """Сколько правок нужно применить, чтобы прочитать запись array_id."""
+        row = conn.execute(
+            """
+            WITH RECURSIVE chain(id, parent_id) AS (
+                SELECT id, parent_id FROM arrays WHERE id=?
+                UNION ALL
+                SELECT a.id, a.parent_id FROM arrays a JOIN chain c ON a.id = c.parent_id
+            )
+            SELECT COUNT(*) - 1 FROM chain
+            """,
+            (array_id,),
+        ).fetchone()
+        return int(row[0])
+
+    @instrument("storage.list_user_arrays", rows=lambda r: len(r[1]))
+    def list_user_arrays(
+        self,
+        user_id: int,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = 100,
+        include_payload: bool = False,
+    ) -> Tuple[bool, Any]:
+        """Страница истории пользователя, от новых записей к старым.
+
+        after_id - id последней записи предыдущей страницы (keyset-пагинация:
+        запрос идёт по индексу и не пропускает строки через OFFSET).
+        limit=None возвращает все записи. Без include_payload массивы не
+        читаются и не декодируются - их можно получить через get_user_array.
+        """
+        columns = "id, length, created_at"
+        if include_payload:
+            columns += ", original_data, sorted_data, parent_id"
+        sql = f"SELECT {columns} FROM arrays WHERE user_id=?"
+        params: List[Any] = [int(user_id)]
+        if after_id is not None:
+            sql += " AND id<?"
+            params.append(int(after_id))
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
+        try:
+            with self._read() as conn:
+                rows = conn.execute(sql, params).fetchall()
+                return True, [self._row_to_item(conn, r, include_payload) for r in rows]
+        except Exception as e:
+            return False, f"Ошибка чтения: {e}"
+
+    @instrument("storage.get_user_array", rows=lambda r: 1)
+    def get_user_array(self, user_id: int, array_id: int) -> Tuple[bool, Any]:
+        """Одна запись истории вместе с массивами."""
+        try:
+            with self._read() as conn:
+                row = conn.execute(
                     """
-                    SELECT id, original_json, sorted_json, length, created_at
+                    SELECT id, length, created_at, original_data, sorted_data, parent_id
                     FROM arrays
-                    WHERE user_id=?
-                    ORDER BY id DESC
+                    WHERE user_id=? AND id=?
                     """,
-                    (int(user_id),),
-                ).fetchall()
-            result: List[Dict[str, Any]] = []
-            for r in rows:
-                result.append(
-                    {
-                        "id": int(r["id"]),
-                        "original": json.loads(r["original_json"]),
-                        "sorted": json.loads(r["sorted_json"]) if r["sorted_json"] else None,
-                        "length": int(r["length"]),
-                        "created_at": str(r["created_at"]),
-                    }
+                    (int(user_id), int(array_id)),
+                ).fetchone()
+                if row is None:
+                    return False, "Запись не найдена"
+                return True, self._row_to_item(conn, row, include_payload=True)
+        except Exception as e:
+            return False, f"Ошибка чтения: {e}"
+
+    @instrument("storage.get_array_preview", rows=lambda r: 1)
+    def get_array_preview(self, user_id: int, array_id: int, limit: int = 50) -> Tuple[bool, Any]:
+        """Запись истории с первыми limit элементами массивов (для таблицы
+        истории): из БД читается только начало payload, и декодируется только
+        оно, поэтому время не зависит от длины массива."""
+        try:
+            with self._read() as conn:
+                row = conn.execute(
+                    """
+                    SELECT id, length, created_at, parent_id,
+                           substr(original_data, 1, :n) AS original_head,
+                           substr(sorted_data, 1, :n) AS sorted_head
+                    FROM arrays
+                    WHERE user_id=:user_id AND id=:id
+                    """,
+                    {"n": prefix_size(limit), "user_id": int(user_id), "id": int(array_id)},
+                ).fetchone()
+                if row is None:
+                    return False, "Запись не найдена"
+                item = self._row_to_item(conn, row, include_payload=False)
+                item["original"] = self._preview(conn, row["id"], "original_data", row["original_head"], limit)
+                item["sorted"] = (
+                    self._preview(conn, row["id"], "sorted_data", row["sorted_head"], limit)
+                    if row["sorted_head"]
+                    else None
                 )
-            return True, result
+                return True, item
         except Exception as e:
             return False, f"Ошибка чтения: {e}"
 
+    def _preview(self, conn: sqlite3.Connection, array_id: int, column: str, head: Any, limit: int) -> List[int]:
+        digest = ref_digest(head)
+        if digest is not None:
+            row = conn.execute(
+                f"SELECT substr({column}, 1, ?) FROM contents WHERE hash=?", (prefix_size(limit), digest)
+            ).fetchone()
+            if row is None or row[0] is None:
+                raise LookupError("Содержимое массива не найдено в contents")
+            head = row[0]
+        location = extern_location(head)
+        if location is not None and self._blobs is not None:
+            offset, count = location
+            return self._blobs.view(offset, min(count, limit), kind="list")
+        values = decode_prefix(head, limit)
+        if values is None:
+            # JSON, FMT_BIGINT и правки читаются целиком.
+            values = self._load_values(conn, array_id, column)[:limit]
+        return values
+
+    def _row_to_item(self, conn: sqlite3.Connection, r: sqlite3.Row, include_payload: bool) -> Dict[str, Any]:
+        item: Dict[str, Any] = {
+            "id": int(r["id"]),
+            "length": int(r["length"]),
+            "created_at": str(r["created_at"]),
+        }
+        if include_payload:
+            parent_id = r["parent_id"]
+            item["original"] = self._decode(conn, r["original_data"], parent_id=parent_id)
+            item["sorted"] = (
+                self._decode(conn, r["sorted_data"], "sorted_data", parent_id) if r["sorted_data"] else None
+            )
+        return item
+
     # Методы для интеграционных тестов (отдельная БД)
-    def insert_bulk_test_arrays(self, arrays: List[List[int]]) -> bool:
+    @instrument("storage.insert_bulk_test_arrays")
+    def insert_bulk_test_arrays(self, arrays: List[Sequence[int]]) -> bool:
         try:
             with self._connect() as conn:
                 conn.executemany(
-                    "INSERT INTO arrays(user_id, original_json, sorted_json, length, created_at) VALUES(?, ?, ?, ?, ?)",
+                    "INSERT INTO arrays(user_id, original_data, sorted_data, length, created_at) VALUES(?, ?, ?, ?, ?)",
                     [
                         (
                             0,
-                            json.dumps(arr, ensure_ascii=False),
+                            self._encode_original(arr),
                             None,
                             len(arr),
                             datetime.now().isoformat(timespec="seconds"),
@@ -176,22 +991,421 @@ class SqliteStorage:
         except Exception:
             return False
 
-    def random_arrays(self, count: int) -> List[List[int]]:
-        with self._connect() as conn:
+    @instrument("storage.ingest_arrays", rows=lambda r: r[1].arrays)
+    def ingest_arrays(
+        self,
+        source: Union[Iterable[Sequence[int]], PathLike],
+        user_id: int = 0,
+        batch_size: int = 1000,
+        sort: bool = False,
+        progress: Optional[Callable[[IngestStats], None]] = None,
+    ) -> Tuple[bool, Any]:
+        """Потоковая загрузка массивов из итератора или файла (.jsonl/.csv/.bin).
+
+        Массивы кодируются и вставляются порциями по batch_size, каждая
+        порция - отдельная транзакция, так что расход памяти ограничен одной
+        порцией, а ошибка теряет только её. При sort=True заполняется и
+        отсортированный массив. progress вызывается после каждой порции.
+        Возвращает (True, IngestStats) или (False, сообщение).
+        """
+        stats = IngestStats()
+        t0 = perf_counter()
+        try:
+            if isinstance(source, (str, os.PathLike)):
+                source = iter_arrays_file(source)
+            it = iter(source)
+            while True:
+                batch = list(islice(it, batch_size))
+                if not batch:
+                    break
+                created_at = datetime.now().isoformat(timespec="seconds")
+                with self._connect() as conn:
+                    conn.executemany(
+                        "INSERT INTO arrays(user_id, original_data, sorted_data, length, created_at) VALUES(?, ?, ?, ?, ?)",
+                        (
+                            (
+                                int(user_id),
+                                self._encode_original(arr),
+                                self._encode_sorted(sort_array(arr)) if sort else None,
+                                len(arr),
+                                created_at,
+                            )
+                            for arr in batch
+                        ),
+                    )
+                stats.arrays += len(batch)
+                stats.elements += sum(len(arr) for arr in batch)
+                stats.batches += 1
+                stats.seconds = perf_counter() - t0
+                if progress is not None:
+                    progress(stats)
+            stats.seconds = perf_counter() - t0
+            return True, stats
+        except Exception as e:
+            return False, f"Ошибка загрузки (сохранено массивов: {stats.arrays}): {e}"
+
+    @instrument("storage.random_arrays", rows=len)
+    def random_arrays(
+        self,
+        count: int,
+        seed: Optional[int] = None,
+        user_id: Optional[int] = None,
+        min_length: Optional[int] = None,
+        max_length: Optional[int] = None,
+    ) -> List[Any]:
+        """Случайная выборка count массивов без повторений.
+
+        При одинаковом seed и неизменной таблице выборка воспроизводима.
+        Фильтры user_id и min_length/max_length ограничивают выборку.
+        """
+        ids = self.sample_array_ids(count, seed, user_id, min_length, max_length)
+        if not ids:
+            return []
+        with self._read() as conn:
+            payload: Dict[int, Tuple[Any, Optional[int]]] = {}
+            for start in range(0, len(ids), _SAMPLE_BATCH):
+                chunk = ids[start : start + _SAMPLE_BATCH]
+                rows = conn.execute(
+                    f"SELECT id, original_data, parent_id FROM arrays WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                payload.update((int(r[0]), (r[1], r[2])) for r in rows)
+            return [self._decode(conn, payload[i][0], parent_id=payload[i][1]) for i in ids if i in payload]
+
+    def sample_array_ids(
+        self,
+        count: int,
+        seed: Optional[int] = None,
+        user_id: Optional[int] = None,
+        min_length: Optional[int] = None,
+        max_length: Optional[int] = None,
+    ) -> List[int]:
+        """Выбирает id случайных строк за O(count), без сортировки всей таблицы.
+
+        Случайные id берутся из диапазона [min(id), max(id)], несуществующие
+        (удалённые) и не прошедшие фильтр отбрасываются. Если за несколько
+        раундов нужное количество не набрано (таблица сильно разрежена или
+        фильтр очень избирателен), выборка делается из списка подходящих id.
+        """
+        count = int(count)
+        if count <= 0:
+            return []
+        rng = random.Random(seed)
+        where, params = self._sample_filter(user_id, min_length, max_length)
+
+        with self._read() as conn:
+            lo, hi = conn.execute("SELECT min(id), max(id) FROM arrays").fetchone()
+            if lo is None:
+                return []
+            span = hi - lo + 1
+
+            chosen: List[int] = []
+            seen: set = set()
+            for _ in range(_SAMPLE_ROUNDS):
+                need = count - len(chosen)
+                if need <= 0 or len(seen) >= span:
+                    break
+                candidates = []
+                for _ in range(min(max(2 * need, 16), span - len(seen))):
+                    x = rng.randint(lo, hi)
+                    if x not in seen:
+                        seen.add(x)
+                        candidates.append(x)
+                found: set = set()
+                for start in range(0, len(candidates), _SAMPLE_BATCH):
+                    chunk = candidates[start : start + _SAMPLE_BATCH]
+                    rows = conn.execute(
+                        f"SELECT id FROM arrays WHERE id IN ({','.join('?' * len(chunk))}){where}",
+                        [*chunk, *params],
+                    ).fetchall()
+                    found.update(int(r[0]) for r in rows)
+                # Порядок кандидатов задаёт генератор, а не SQLite - это
+                # делает выборку воспроизводимой.
+                chosen.extend(x for x in candidates if x in found)
+            if len(chosen) >= count:
+                return chosen[:count]
+
+            rows = conn.execute(f"SELECT id FROM arrays WHERE 1=1{where} ORDER BY id", params).fetchall()
+        all_ids = [int(r[0]) for r in rows]
+        return rng.sample(all_ids, min(count, len(all_ids)))
+
+    @staticmethod
+    def _sample_filter(
+        user_id: Optional[int], min_length: Optional[int], max_length: Optional[int]
+    ) -> Tuple[str, List[Any]]:
+        where = ""
+        params: List[Any] = []
+        if user_id is not None:
+            where += " AND user_id=?"
+            params.append(int(user_id))
+        if min_length is not None:
+            where += " AND length>=?"
+            params.append(int(min_length))
+        if max_length is not None:
+            where += " AND length<=?"
+            params.append(int(max_length))
+        return where, params
+
+    @instrument("storage.total_count")
+    def total_count(self) -> int:
+        return self.array_stats()["arrays"]
+
+    @instrument("storage.array_stats")
+    def array_stats(self, user_id: Optional[int] = None) -> Dict[str, Any]:
+        """Число массивов, число элементов и гистограмма длин - для
+        пользователя user_id или по всем пользователям (None).
+
+        Читается из array_stats (не больше len(LENGTH_BUCKETS) + 1 строк),
+        таблица arrays не просматривается.
+        """
+        key = STATS_ALL_USERS if user_id is None else int(user_id)
+        with self._read() as conn:
             rows = conn.execute(
-                "SELECT original_json FROM arrays ORDER BY RANDOM() LIMIT ?", (int(count),)
+                "SELECT bucket, arrays, elements FROM array_stats WHERE user_id=?", (key,)
             ).fetchall()
-        return [json.loads(r[0]) for r in rows]
+        labels = [*map(str, LENGTH_BUCKETS), "+Inf"]
+        histogram = dict.fromkeys(labels, 0)
+        for r in rows:
+            histogram[labels[int(r["bucket"])]] = int(r["arrays"])
+        return {
+            "arrays": sum(int(r["arrays"]) for r in rows),
+            "elements": sum(int(r["elements"]) for r in rows),
+            "length_buckets": histogram,
+        }
 
-    def total_count(self) -> int:
-        with self._connect() as conn:
-            row = conn.execute("SELECT COUNT(*) AS c FROM arrays").fetchone()
-        return int(row["c"]) if row else 0
+    @instrument("storage.reconcile_stats")
+    def reconcile_stats(self) -> bool:
+        """Пересчитывает array_stats по таблице arrays.
 
+        Нужен, если arrays меняли в обход триггеров (например, после
+        восстановления из копии или правки БД с удалёнными триггерами).
+        """
+        try:
+            with self._connect() as conn:
+                self._rebuild_stats(conn)
+            return True
+        except Exception:
+            return False
+
+    @instrument("storage.clear_all_arrays")
     def clear_all_arrays(self) -> bool:
+        """Удаляет все массивы.
+
+        Таблицы пересоздаются (DROP + CREATE) вместо построчного DELETE: не
+        выполняются триггеры и обновления индексов, а в журнал попадают
+        только освободившиеся страницы. Счётчик id (AUTOINCREMENT)
+        сохраняется, чтобы новые записи не получили id удалённых. Всё
+        пересоздание - одна транзакция: при сбое таблицы остаются прежними.
+        Место в файле данных освобождает отдельный вызов compact_data_file().
+        """
+        try:
+            with self._connect() as conn:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='arrays'").fetchone()
+                conn.execute("DROP TABLE arrays")
+                conn.execute("DROP TABLE contents")
+                self._create_array_tables(conn)
+                self._create_stats(conn)
+                self._create_content_refs(conn)
+                conn.execute("DELETE FROM array_stats")
+                if seq is not None:
+                    conn.execute("INSERT INTO sqlite_sequence(name, seq) VALUES('arrays', ?)", (seq[0],))
+            return True
+        except Exception:
+            return False
+
+    @instrument("storage.purge_arrays", rows=lambda r: r[1] if r[0] else 0)
+    def purge_arrays(
+        self,
+        older_than: Optional[Union[float, timedelta]] = None,
+        keep_last: Optional[int] = None,
+        user_id: Optional[int] = None,
+        batch_size: int = 1000,
+        pause: float = 0.0,
+    ) -> Tuple[bool, Any]:
+        """Удаляет историю по правилам хранения.
+
+        older_than - записи старше заданного возраста (секунды или timedelta),
+        keep_last - оставить у каждого пользователя (или только у user_id)
+        не больше keep_last последних записей. Удаление идёт порциями по
+        batch_size строк, каждая порция - отдельная короткая транзакция, а
+        между ними можно сделать паузу pause секунд, так что писатели не
+        блокируются надолго. Записи-правки, чей родитель удаляется,
+        предварительно сохраняются целиком. Содержимое contents, на которое
+        больше не ссылается ни одна запись, удаляется в той же порции
+        (триггеры contents_refs_*). Освободившееся место в файле БД
+        возвращает reclaim_space(), в файле данных - compact_data_file(),
+        который выполняется отдельно, без параллельных писателей.
+        Возвращает (True, число удалённых записей).
+        """
+        deleted = 0
         try:
+            if older_than is not None:
+                if not isinstance(older_than, timedelta):
+                    older_than = timedelta(seconds=older_than)
+                cutoff = (datetime.now() - older_than).isoformat(timespec="seconds")
+                where, params = "created_at < ?", [cutoff]
+                if user_id is not None:
+                    where += " AND user_id=?"
+                    params.append(int(user_id))
+                deleted += self._delete_in_batches(where, params, batch_size, pause)
+
+            if keep_last is not None:
+                if user_id is not None:
+                    users = [int(user_id)]
+                else:
+                    # Кандидатов берём из счётчиков, без просмотра arrays.
+                    with self._read() as conn:
+                        rows = conn.execute(
+                            "SELECT user_id FROM array_stats WHERE user_id<>? GROUP BY user_id HAVING SUM(arrays) > ?",
+                            (STATS_ALL_USERS, int(keep_last)),
+                        ).fetchall()
+                    users = [int(r[0]) for r in rows]
+                for uid in users:
+                    with self._read() as conn:
+                        row = conn.execute(
+                            "SELECT id FROM arrays WHERE user_id=? ORDER BY id DESC LIMIT 1 OFFSET ?",
+                            (uid, max(int(keep_last), 0)),
+                        ).fetchone()
+                    if row is not None:
+                        deleted += self._delete_in_batches(
+                            "user_id=? AND id<=?", [uid, int(row[0])], batch_size, pause
+                        )
+            return True, deleted
+        except Exception as e:
+            return False, f"Ошибка удаления (удалено записей: {deleted}): {e}"
+
+    def _delete_in_batches(self, where: str, params: List[Any], batch_size: int, pause: float) -> int:
+        deleted = 0
+        while True:
             with self._connect() as conn:
-                conn.execute("DELETE FROM arrays")
+                ids = [
+                    int(r[0])
+                    for r in conn.execute(
+                        f"SELECT id FROM arrays WHERE {where} ORDER BY id LIMIT ?", [*params, int(batch_size)]
+                    ).fetchall()
+                ]
+                if ids:
+                    marks = ",".join("?" * len(ids))
+                    self._detach_children(conn, ids)
+                    conn.execute(f"DELETE FROM arrays WHERE id IN ({marks})", ids)
+            deleted += len(ids)
+            if len(ids) < batch_size:
+                return deleted
+            if pause:
+                sleep(pause)
+
+    def _detach_children(self, conn: sqlite3.Connection, ids: List[int]) -> None:
+        """Сохраняет целиком правки, родители которых входят в ids."""
+        marks = ",".join("?" * len(ids))
+        rows = conn.execute(
+            f"""
+            SELECT id, original_data, sorted_data, parent_id FROM arrays
+            WHERE parent_id IN ({marks}) AND id NOT IN ({marks})
+            """,
+            [*ids, *ids],
+        ).fetchall()
+        for r in rows:
+            original = self._decode(conn, r["original_data"], parent_id=r["parent_id"], kind="list")
+            sorted_values = None
+            if r["sorted_data"] is not None:
+                sorted_values = self._decode(conn, r["sorted_data"], "sorted_data", r["parent_id"], kind="list")
+            conn.execute(
+                "UPDATE arrays SET original_data=?, sorted_data=?, parent_id=NULL WHERE id=?",
+                (self._encode_original(original), self._encode_sorted(sorted_values), int(r["id"])),
+            )
+
+    @instrument("storage.reclaim_space")
+    def reclaim_space(self, max_pages: Optional[int] = None, chunk_pages: int = 1000) -> Tuple[bool, Any]:
+        """Возвращает файловой системе свободные страницы БД (incremental vacuum).
+
+        Страницы освобождаются порциями по chunk_pages, каждая - отдельной
+        транзакцией. Работает для БД с auto_vacuum=INCREMENTAL (так создаются
+        новые БД); старую БД переводит в этот режим однократный vacuum().
+        Возвращает (True, число освобождённых страниц).
+        """
+        try:
+            conn = self._thread_conn(read_only=False)
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return False, "Инкрементальная очистка не включена - выполните vacuum()"
+            freed = 0
+            while max_pages is None or freed < max_pages:
+                free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                step = min(free, chunk_pages, max_pages - freed if max_pages is not None else free)
+                if step <= 0:
+                    break
+                # executescript выполняет прагму до конца (execute освобождает
+                # только одну страницу) и фиксирует её сразу.
+                conn.executescript(f"PRAGMA incremental_vacuum({int(step)});")
+                freed += step
+            return True, freed
+        except Exception as e:
+            return False, f"Ошибка очистки: {e}"
+
+    @instrument("storage.vacuum")
+    def vacuum(self) -> bool:
+        """Полностью перестраивает файл БД и включает incremental vacuum.
+
+        Блокирует БД на всё время работы - для обслуживания, не для
+        регулярного запуска; дальше место возвращает reclaim_space().
+        """
+        try:
+            conn = self._thread_conn(read_only=False)
+            conn.commit()
+            conn.executescript("PRAGMA auto_vacuum=INCREMENTAL; VACUUM;")
             return True
         except Exception:
             return False
+
+    @instrument("storage.compact_data_file")
+    def compact_data_file(self) -> Tuple[bool, Any]:
+        """Освобождает в файле данных место удалённых массивов.
+
+        Живые массивы переписываются в файл следующего поколения, а ссылки на
+        них и номер поколения (storage_meta) обновляются одной транзакцией,
+        что блокирует запись в БД на время сжатия. Прежний файл удаляется
+        только после коммита: при ошибке или сбое до него ссылки и текущий
+        файл остаются согласованными. Уже выданные представления остаются
+        корректными, но выполнять сжатие следует без параллельных читателей и
+        писателей: прочитанная или записанная до сжатия ссылка указывает на
+        старое смещение. Возвращает (True, освобождено байт).
+        """
+        if self._blobs is None:
+            return False, "Файл данных не используется"
+        marker = bytes((FMT_EXTERN,))
+        before = self._blobs.size
+        new_path = None
+        try:
+            with self._connect() as conn:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                generation = self._data_generation(conn) + 1
+                new_path = _generation_path(self.data_file, generation)
+                refs = []
+                for table, key in (("arrays", "id"), ("contents", "hash")):
+                    for column in ("original_data", "sorted_data"):
+                        rows = conn.execute(
+                            f"SELECT {key}, {column} FROM {table} WHERE substr({column}, 1, 1) = ?",
+                            (marker,),
+                        ).fetchall()
+                        refs.extend((table, key, column, r[0], extern_location(r[1])) for r in rows)
+                moved = self._blobs.compact((location for *_, location in refs), new_path)
+                for table, key, column, row_key, (offset, count) in refs:
+                    conn.execute(
+                        f"UPDATE {table} SET {column}=? WHERE {key}=?",
+                        (encode_extern(moved[offset], count), row_key),
+                    )
+                conn.execute(
+                    """
+                    INSERT INTO storage_meta(key, value) VALUES('data_generation', ?)
+                    ON CONFLICT(key) DO UPDATE SET value=excluded.value
+                    """,
+                    (generation,),
+                )
+            self._blobs.switch(new_path)
+            return True, before - self._blobs.size
+        except Exception as e:
+            if new_path is not None and new_path != self._blobs.path and os.path.exists(new_path):
+                os.remove(new_path)
+            return False, f"Ошибка сжатия файла данных: {e}"
@@ -0,0 +1,181 @@
+"""Внешняя сортировка слиянием для массивов, не помещающихся в память.
+
+Вход - двоичный файл little-endian int64 (как в БД, но без заголовка) или
+любой итератор целых. Данные читаются порциями в пределах memory_limit,
+каждая порция сортируется самым быстрым доступным движком (sort_array) и
+сбрасывается во временный файл-серию. Затем серии сливаются k-путевым
+слиянием через кучу (heapq.merge); если серий больше fan_in, слияние идёт в
+несколько проходов. Порождение серий из файла можно распараллелить по
+процессам - каждый процесс сам читает свой участок входного файла.
+"""
+
+from __future__ import annotations
+
+import heapq
+import os
+import shutil
+import sys
+import tempfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Union
+
+from array_io import PathLike
+from sort_alg import np, sort_array
+
+ITEM_SIZE = 8
+# Примерный расход памяти на элемент при сортировке: 8 байт в NumPy и
+# ~40 байт (ссылка + объект int) при сортировке списка Python.
+_BYTES_PER_ITEM = 8 if np is not None else 40
+_IO_BLOCK = 64 * 1024  # элементов за одно чтение/запись при слиянии
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+def external_sort(
+    source: Union[PathLike, Iterable[int]],
+    output: Optional[PathLike] = None,
+    memory_limit: int = 256 * 1024 * 1024,
+    workers: int = 1,
+    fan_in: int = 64,
+    tmp_dir: Optional[str] = None,
+) -> Union[int, Iterator[int]]:
+    """Сортирует source, не загружая его в память целиком.
+
+    memory_limit - бюджет памяти на все процессы генерации серий (байт).
+    Если задан output, результат пишется туда в формате little-endian int64
+    и возвращается число элементов; иначе возвращается генератор значений
+    (временные файлы удаляются, когда он исчерпан или закрыт).
+    """
+    workers = max(1, workers)
+    chunk_items = max(_IO_BLOCK, memory_limit // (_BYTES_PER_ITEM * workers))
+    work_dir = tempfile.mkdtemp(prefix="extsort-", dir=tmp_dir)
+    try:
+        if isinstance(source, (str, os.PathLike)):
+            runs = _runs_from_file(source, chunk_items, workers, work_dir)
+        else:
+            runs = _runs_from_iter(iter(source), chunk_items, workers, work_dir)
+        runs = _reduce_runs(runs, fan_in, work_dir)
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+    if output is None:
+        return _stream_and_cleanup(runs, work_dir)
+    try:
+        with open(output, "wb") as f:
+            return _write_values(f, heapq.merge(*(_iter_run(r) for r in runs)), little_endian=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _runs_from_file(path: PathLike, chunk_items: int, workers: int, work_dir: str) -> List[str]:
+    total = os.path.getsize(path)
+    if total % ITEM_SIZE:
+        raise ValueError("Размер файла не кратен 8 байтам (ожидается int64)")
+    count = total // ITEM_SIZE
+    tasks = [
+        (os.fspath(path), start, min(chunk_items, count - start), os.path.join(work_dir, f"run{i}.bin"))
+        for i, start in enumerate(range(0, count, chunk_items))
+    ]
+    if workers == 1 or len(tasks) == 1:
+        return [_sort_file_chunk(*t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_sort_file_chunk, *zip(*tasks)))
+
+
+def _sort_file_chunk(path: str, start: int, count: int, run_path: str) -> str:
+    values = array("q")
+    with open(path, "rb") as f:
+        f.seek(start * ITEM_SIZE)
+        values.fromfile(f, count)
+    if _BIG_ENDIAN:
+        values.byteswap()
+    return _write_run(values, run_path)
+
+
+def _runs_from_iter(it: Iterator[int], chunk_items: int, workers: int, work_dir: str) -> List[str]:
+    runs: List[str] = []
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    pending = []
+    try:
+        while True:
+            values = array("q", islice(it, chunk_items))
+            if not values:
+                break
+            run_path = os.path.join(work_dir, f"run{len(runs) + len(pending)}.bin")
+            if pool is None:
+                runs.append(_write_run(values, run_path))
+                continue
+            # Не больше workers порций в работе, чтобы не выйти за бюджет памяти.
+            if len(pending) >= workers:
+                runs.append(pending.pop(0).result())
+            pending.append(pool.submit(_write_run, values, run_path))
+        runs.extend(f.result() for f in pending)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return runs
+
+
+def _write_run(values: array, run_path: str) -> str:
+    values = sort_array(values)
+    with open(run_path, "wb") as f:
+        values.tofile(f)  # серии во временных файлах - в родном порядке байт
+    return run_path
+
+
+def _reduce_runs(runs: List[str], fan_in: int, work_dir: str) -> List[str]:
+    """Сливает серии группами по fan_in, пока их не останется не больше fan_in."""
+    fan_in = max(2, fan_in)
+    level = 0
+    while len(runs) > fan_in:
+        merged = []
+        for i in range(0, len(runs), fan_in):
+            group = runs[i : i + fan_in]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            out_path = os.path.join(work_dir, f"merge{level}_{i}.bin")
+            with open(out_path, "wb") as f:
+                _write_values(f, heapq.merge(*(_iter_run(r) for r in group)), little_endian=False)
+            for r in group:
+                os.remove(r)
+            merged.append(out_path)
+        runs = merged
+        level += 1
+    return runs
+
+
+def _iter_run(path: str) -> Iterator[int]:
+    with open(path, "rb") as f:
+        while True:
+            block = array("q")
+            try:
+                block.fromfile(f, _IO_BLOCK)
+            except EOFError:
+                pass  # последний неполный блок уже прочитан в block
+            if not block:
+                return
+            yield from block
+
+
+def _write_values(f: BinaryIO, values: Iterable[int], little_endian: bool) -> int:
+    written = 0
+    swap = little_endian and _BIG_ENDIAN
+    it = iter(values)
+    while True:
+        block = array("q", islice(it, _IO_BLOCK))
+        if not block:
+            return written
+        if swap:
+            block.byteswap()
+        block.tofile(f)
+        written += len(block)
+
+
+def _stream_and_cleanup(runs: List[str], work_dir: str) -> Iterator[int]:
+    try:
+        yield from heapq.merge(*(_iter_run(r) for r in runs))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
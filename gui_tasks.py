@@ -0,0 +1,173 @@
+"""Фоновое выполнение долгих операций GUI.
+
+Tk не потокобезопасен, поэтому рабочий поток никогда не обращается к
+виджетам: он только выполняет функцию и сохраняет результат. Главный поток
+опрашивает задачу через root.after и сам вызывает обработчики.
+"""
+
+from __future__ import annotations
+
+import threading
+import tkinter as tk
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import perf_counter
+from typing import Any, Callable, Optional
+
+
+class TaskCancelled(Exception):
+    """Задача завершилась по запросу отмены."""
+
+
+class Task:
+    """Состояние задачи, доступное функции в рабочем потоке."""
+
+    def __init__(self, description: str):
+        self.description = description
+        self.started = perf_counter()
+        self._cancel = threading.Event()
+        self._progress: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def check(self) -> None:
+        """Выбрасывает TaskCancelled, если задачу отменили."""
+        if self._cancel.is_set():
+            raise TaskCancelled()
+
+    def report(self, text: str) -> None:
+        """Текст прогресса для строки состояния (вызывается из рабочего потока)."""
+        self._progress = text
+
+    @property
+    def progress(self) -> Optional[str]:
+        return self._progress
+
+
+class BackgroundRunner:
+    """Выполняет по одной задаче в фоновом потоке.
+
+    Пока задача выполняется, новые не принимаются (busy), а строка состояния
+    показывает описание, прогресс и время выполнения. Короткие запросы для
+    отображения (страницы истории, превью) выполняет fetch() в отдельном
+    потоке - они не занимают слот задачи и не ждут её завершения.
+    """
+
+    def __init__(self, root: tk.Misc, status: tk.StringVar, poll_ms: int = 100, fetch_poll_ms: int = 20):
+        self.root = root
+        self.status = status
+        self.poll_ms = poll_ms
+        self.fetch_poll_ms = fetch_poll_ms
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gui-task")
+        self._fetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gui-fetch")
+        self._task: Optional[Task] = None
+        self._future: Optional[Future] = None
+        self._on_done: Optional[Callable[[Any], None]] = None
+        self._on_error: Optional[Callable[[BaseException], None]] = None
+
+    @property
+    def busy(self) -> bool:
+        return self._task is not None
+
+    def submit(
+        self,
+        description: str,
+        fn: Callable[[Task], Any],
+        on_done: Callable[[Any], None],
+        on_error: Optional[Callable[[BaseException], None]] = None,
+    ) -> bool:
+        """Запускает fn(task) в фоне. Возвращает False, если уже есть активная задача.
+
+        on_done/on_error вызываются в главном потоке. Задача, прерванная
+        отменой (fn выбросила TaskCancelled), обработчиков не вызывает.
+        """
+        if self.busy:
+            return False
+        self._task = Task(description)
+        self._on_done = on_done
+        self._on_error = on_error
+        self._future = self._executor.submit(fn, self._task)
+        self.status.set(f"{description}...")
+        self.root.config(cursor="watch")
+        self.root.after(self.poll_ms, self._poll)
+        return True
+
+    def cancel(self) -> bool:
+        """Запрашивает отмену активной задачи. Задача, которая не проверяет
+        отмену (task.check()), завершится и сообщит результат как обычно."""
+        if self._task is None:
+            return False
+        self._task.cancel()
+        return True
+
+    def fetch(
+        self,
+        fn: Callable[[], Any],
+        on_done: Callable[[Any], None],
+        on_error: Optional[Callable[[BaseException], None]] = None,
+    ) -> Future:
+        """Выполняет fn() в фоне; on_done(результат) или on_error(исключение)
+        вызываются в главном потоке через root.after."""
+        future = self._fetch_executor.submit(fn)
+
+        def poll() -> None:
+            if not future.done():
+                self.root.after(self.fetch_poll_ms, poll)
+                return
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is None:
+                on_done(future.result())
+            elif on_error is not None:
+                on_error(error)
+            else:
+                self.status.set(f"Ошибка: {error}")
+
+        self.root.after(self.fetch_poll_ms, poll)
+        return future
+
+    def _poll(self) -> None:
+        task, future = self._task, self._future
+        if task is None or future is None:
+            return
+        if not future.done():
+            if task.cancelled:
+                text = f"{task.description}: отмена..."
+            else:
+                elapsed = perf_counter() - task.started
+                progress = f" {task.progress}" if task.progress else ""
+                text = f"{task.description}...{progress} ({elapsed:.1f} с)"
+            self.status.set(text)
+            self.root.after(self.poll_ms, self._poll)
+            return
+
+        on_done, on_error = self._on_done, self._on_error
+        self._task = self._future = self._on_done = self._on_error = None
+        try:
+            self.root.config(cursor="")
+        except tk.TclError:
+            return  # окно уже закрыто
+
+        error = future.exception()
+        # Об отмене сообщаем, только если работа действительно прервана:
+        # операция, завершившаяся несмотря на запрос отмены (например,
+        # сохранение), уже выполнена, и её результат нужно показать.
+        if isinstance(error, TaskCancelled):
+            self.status.set(f"{task.description}: отменено")
+        elif error is not None:
+            if on_error is not None:
+                on_error(error)
+            else:
+                self.status.set(f"{task.description}: ошибка: {error}")
+        else:
+            on_done(future.result())
+
+    def shutdown(self) -> None:
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._fetch_executor.shutdown(wait=False, cancel_futures=True)
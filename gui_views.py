@@ -0,0 +1,298 @@
+"""Виджеты для больших массивов и длинной истории.
+
+ArrayView показывает только видимый фрагмент массива: строки формируются по
+мере прокрутки, поэтому массив из миллионов элементов не превращается в
+одну гигантскую строку внутри tk.Text. HistoryTable подгружает историю из БД
+страницами, когда пользователь докручивает список до конца.
+"""
+
+from __future__ import annotations
+
+import tkinter as tk
+from tkinter import ttk
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+
+PREVIEW_LIMIT = 50
+
+
+def format_preview(values: Optional[Sequence[int]], limit: int = PREVIEW_LIMIT, total: Optional[int] = None) -> str:
+    """Краткое представление массива: первые limit элементов и число остальных.
+
+    total - полная длина, если values - только начало массива.
+    """
+    if values is None:
+        return "-"
+    head = ", ".join(map(str, values[:limit]))
+    rest = (len(values) if total is None else total) - limit
+    if rest > 0:
+        return f"[{head}, ... (ещё {rest})]"
+    return f"[{head}]"
+
+
+class ArrayView(ttk.Frame):
+    """Окно просмотра массива с виртуальной прокруткой и переходом к индексу.
+
+    Короткие массивы выводятся целиком, как список. Длинные разбиваются на
+    строки по per_line элементов с индексом первого элемента в начале строки,
+    и форматируются только строки, попадающие в видимую область.
+    """
+
+    def __init__(self, master: tk.Misc, height: int = 4, per_line: int = 12):
+        super().__init__(master)
+        self.height = height
+        self.per_line = per_line
+        self.values: Optional[Sequence[int]] = None
+        self.first_line = 0
+
+        body = ttk.Frame(self)
+        body.pack(fill="x")
+        self.text = tk.Text(body, height=height, wrap="none")
+        self.text.pack(side="left", fill="x", expand=True)
+        self.scroll = ttk.Scrollbar(body, orient="vertical", command=self._on_scroll)
+        self.scroll.pack(side="right", fill="y")
+
+        self.jump_row = ttk.Frame(self)
+        ttk.Label(self.jump_row, text="Перейти к индексу:").pack(side="left")
+        self.jump_entry = ttk.Entry(self.jump_row, width=12)
+        self.jump_entry.pack(side="left", padx=6)
+        self.jump_entry.bind("<Return>", lambda _e: self._jump())
+        ttk.Button(self.jump_row, text="Перейти", command=self._jump).pack(side="left")
+        self.info = ttk.Label(self.jump_row, foreground="#444")
+        self.info.pack(side="left", padx=10)
+
+        for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.text.bind(seq, self._on_wheel)
+
+    @property
+    def total_lines(self) -> int:
+        if self.values is None:
+            return 0
+        return (len(self.values) + self.per_line - 1) // self.per_line
+
+    @property
+    def windowed(self) -> bool:
+        return self.total_lines > self.height
+
+    def set_values(self, values: Optional[Sequence[int]]) -> None:
+        self.values = values
+        self.first_line = 0
+        if self.windowed:
+            self.jump_row.pack(fill="x", pady=(2, 0))
+        else:
+            self.jump_row.pack_forget()
+        self._render()
+
+    def show_index(self, index: int) -> None:
+        """Прокручивает так, чтобы элемент index оказался в первой строке."""
+        self._set_first_line(index // self.per_line)
+
+    def _set_first_line(self, line: int) -> None:
+        line = max(0, min(line, self.total_lines - self.height))
+        if line != self.first_line:
+            self.first_line = line
+            self._render()
+
+    def _render(self) -> None:
+        self.text.configure(state="normal")
+        self.text.delete("1.0", tk.END)
+        values = self.values
+        if values is None or len(values) == 0:
+            self.scroll.set(0.0, 1.0)
+        elif not self.windowed:
+            self.text.configure(wrap="word")
+            self.text.insert(tk.END, format_preview(values, len(values)))
+            self.scroll.set(0.0, 1.0)
+        else:
+            self.text.configure(wrap="none")
+            lines = []
+            width = len(str(len(values) - 1))
+            for line in range(self.first_line, min(self.first_line + self.height, self.total_lines)):
+                start = line * self.per_line
+                chunk = values[start : start + self.per_line]
+                lines.append(f"[{start:>{width}}] " + ", ".join(map(str, chunk)))
+            self.text.insert(tk.END, "\n".join(lines))
+            total = self.total_lines
+            self.scroll.set(self.first_line / total, (self.first_line + self.height) / total)
+            last = min(len(values), (self.first_line + self.height) * self.per_line) - 1
+            self.info.configure(
+                text=f"элементы {self.first_line * self.per_line}-{last} из {len(values)}"
+            )
+        self.text.configure(state="disabled")
+
+    def _on_scroll(self, action: str, amount: str, unit: Optional[str] = None) -> None:
+        if not self.windowed:
+            return
+        if action == "moveto":
+            self._set_first_line(int(float(amount) * self.total_lines))
+        elif action == "scroll":
+            step = self.height if unit == "pages" else 1
+            self._set_first_line(self.first_line + int(amount) * step)
+
+    def _on_wheel(self, event: tk.Event) -> str:
+        if self.windowed:
+            if event.num == 4 or getattr(event, "delta", 0) > 0:
+                self._set_first_line(self.first_line - 1)
+            else:
+                self._set_first_line(self.first_line + 1)
+        return "break"
+
+    def _jump(self) -> None:
+        if not self.windowed:
+            return
+        try:
+            index = int(self.jump_entry.get().strip())
+        except ValueError:
+            self.info.configure(text="Индекс должен быть целым числом")
+            return
+        if not 0 <= index < len(self.values):
+            self.info.configure(text=f"Индекс вне диапазона 0..{len(self.values) - 1}")
+            return
+        self.show_index(index)
+
+
+class HistoryTable(ttk.Frame):
+    """Таблица истории с постраничной подгрузкой при прокрутке.
+
+    fetch_page(after_id, limit) возвращает метаданные следующей страницы,
+    fetch_item(array_id) - запись целиком, fetch_preview(array_id) - запись
+    только с началом массивов (по умолчанию fetch_item); массивы
+    запрашиваются только для выбранной строки, а в таблицу попадает их
+    краткое представление. on_open(item) вызывается по двойному щелчку или
+    Enter на строке. Функции выборки сообщают об ошибке исключением.
+
+    run_async(fn, on_done, on_error) выполняет запрос в фоне и вызывает
+    обработчики в главном потоке (BackgroundRunner.fetch); без него запросы
+    выполняются синхронно. Ошибки запросов порождают событие <<HistoryError>>,
+    текст ошибки - в last_error.
+    """
+
+    columns = ("id", "len", "created", "orig", "sorted")
+
+    def __init__(
+        self,
+        master: tk.Misc,
+        fetch_page: Callable[[Optional[int], int], List[Dict[str, Any]]],
+        fetch_item: Callable[[int], Optional[Dict[str, Any]]],
+        page_size: int = 200,
+        on_open: Optional[Callable[[Dict[str, Any]], None]] = None,
+        fetch_preview: Optional[Callable[[int], Optional[Dict[str, Any]]]] = None,
+        run_async: Optional[Callable[..., Any]] = None,
+    ):
+        super().__init__(master)
+        self.fetch_page = fetch_page
+        self.fetch_item = fetch_item
+        self.fetch_preview = fetch_preview or fetch_item
+        self.on_open = on_open
+        self.run_async = run_async or _run_now
+        self.page_size = page_size
+        self.last_id: Optional[int] = None
+        self.exhausted = False
+        self.loaded = 0
+        self.last_error: Optional[str] = None
+        self._loading = False
+        self._previewed: Set[str] = set()
+
+        self.tree = ttk.Treeview(self, columns=self.columns, show="headings")
+        for col, title, width in (
+            ("id", "ID", 60),
+            ("len", "Размер", 70),
+            ("created", "Дата", 150),
+            ("orig", "Исходный", 280),
+            ("sorted", "Отсортированный", 280),
+        ):
+            self.tree.heading(col, text=title)
+            self.tree.column(col, width=width, anchor="center" if col in ("id", "len") else "w")
+
+        self.scroll = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scroll.pack(side="right", fill="y")
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<Double-1>", self._on_open)
+        self.tree.bind("<Return>", self._on_open)
+
+        self.load_more()
+
+    def load_more(self) -> None:
+        if self.exhausted or self._loading:
+            return
+        self._loading = True
+        after_id, limit = self.last_id, self.page_size
+        self.run_async(lambda: self.fetch_page(after_id, limit), self._add_page, self._failed)
+
+    def _add_page(self, items: List[Dict[str, Any]]) -> None:
+        self._loading = False
+        if not self.winfo_exists():
+            return  # окно закрыли, пока шёл запрос
+        for item in items:
+            self.tree.insert(
+                "",
+                "end",
+                iid=str(item["id"]),
+                values=(item["id"], item["length"], item["created_at"], "...", "..."),
+            )
+        self.loaded += len(items)
+        if items:
+            self.last_id = items[-1]["id"]
+        if len(items) < self.page_size:
+            self.exhausted = True
+        self.event_generate("<<HistoryLoaded>>")
+
+    def _failed(self, error: BaseException) -> None:
+        self._loading = False
+        if self.winfo_exists():
+            self.last_error = str(error)
+            self.event_generate("<<HistoryError>>")
+
+    def _on_tree_scroll(self, first: str, last: str) -> None:
+        self.scroll.set(first, last)
+        # Подгружаем следующую страницу, когда видна последняя десятая часть.
+        if float(last) > 0.9 and not self.exhausted and not self._loading:
+            self.after_idle(self.load_more)
+
+    def _on_select(self, _event: tk.Event) -> None:
+        for iid in self.tree.selection():
+            if iid in self._previewed:
+                continue
+            self._previewed.add(iid)
+            array_id = int(iid)
+            self.run_async(
+                lambda array_id=array_id: self.fetch_preview(array_id),
+                lambda item, iid=iid: self._show_preview(iid, item),
+                lambda error, iid=iid: self._preview_failed(iid, error),
+            )
+
+    def _show_preview(self, iid: str, item: Optional[Dict[str, Any]]) -> None:
+        if item is None or not self.winfo_exists() or not self.tree.exists(iid):
+            self._previewed.discard(iid)
+            return
+        self.tree.set(iid, "orig", format_preview(item["original"], total=item["length"]))
+        self.tree.set(iid, "sorted", format_preview(item["sorted"], total=item["length"]))
+
+    def _preview_failed(self, iid: str, error: BaseException) -> None:
+        self._previewed.discard(iid)
+        self._failed(error)
+
+    def _on_open(self, _event: tk.Event) -> None:
+        if self.on_open is None:
+            return
+        for iid in self.tree.selection()[:1]:
+            array_id = int(iid)
+            self.run_async(lambda: self.fetch_item(array_id), self._open_item, self._failed)
+
+    def _open_item(self, item: Optional[Dict[str, Any]]) -> None:
+        if item is not None and self.on_open is not None:
+            self.on_open(item)
+
+
+def _run_now(
+    fn: Callable[[], Any],
+    on_done: Callable[[Any], None],
+    on_error: Callable[[BaseException], None],
+) -> None:
+    try:
+        result = fn()
+    except Exception as e:
+        on_error(e)
+        return
+    on_done(result)
@@ -1,9 +1,37 @@
+"""GUI сервиса сортировки массивов.
+
+Запуск оптимизирован: при старте импортируются только tkinter и модули
+виджетов, а хранилище, хеширование паролей и сортировки подгружаются в
+фоновом потоке, пока показано окно входа, и создаются при первом обращении.
+Ключ --startup-report печатает, на что уходит время запуска.
+"""
+
+from __future__ import annotations
+
 import random
+import sys
+import threading
 import tkinter as tk
-from tkinter import messagebox, ttk
+from functools import cached_property
+from time import perf_counter
+from tkinter import filedialog, messagebox, ttk
+from typing import TYPE_CHECKING, Callable
+
+from array_parse import ArrayParseError, parse_array, parse_array_file
+from gui_tasks import BackgroundRunner, Task
+from gui_views import PREVIEW_LIMIT, ArrayView, HistoryTable
+
+if TYPE_CHECKING:
+    from auth import Authenticator
+    from db_layer import SqliteStorage, User
+    from sort_cache import SortCache
+
+_STARTED_AT = perf_counter()
 
-from db_layer import SqliteStorage, User
-from sort_alg import quick_sort
+DB_PATH = "sorting_app.db"
+# Модули, которые не нужны для окна входа: их импорт (NumPy, sqlite3,
+# hashlib, multiprocessing) переносится в фоновый поток.
+_DEFERRED_MODULES = ("db_layer", "auth", "sort_cache", "array_delta", "sort_alg")
 
 
 class ArraySorterGUI:
@@ -12,16 +40,49 @@ class ArraySorterGUI:
         self.root.title("Сервис сортировки массивов")
         self.root.geometry("820x640")
 
-        self.storage = SqliteStorage("sorting_app.db")
-
         self.user: User | None = None
         self.src: list[int] = []
         self.dst: list[int] | None = None
+        # Запись истории, загруженная для правки: (id, исходный, отсортированный).
+        # Пока она задана, сортировка и сохранение работают с правкой относительно неё.
+        self.base: tuple[int, list[int], list[int] | None] | None = None
 
         self.status = tk.StringVar(value="Готово")
+        self.tasks = BackgroundRunner(self.root, self.status)
         self.input_mode = tk.StringVar(value="manual")  # manual | random
 
         self._build_login()
+        self.root.after_idle(self._prewarm)
+
+    # -------------------- Lazy services --------------------
+
+    @cached_property
+    def storage(self) -> SqliteStorage:
+        from db_layer import SqliteStorage
+
+        return SqliteStorage(DB_PATH, dedup=True)
+
+    @cached_property
+    def sort_cache(self) -> SortCache:
+        from sort_cache import SortCache
+
+        return SortCache(storage=self.storage)
+
+    @cached_property
+    def auth(self) -> Authenticator:
+        from auth import Authenticator
+
+        return Authenticator(self.storage, workers=1)
+
+    def _prewarm(self) -> None:
+        """Импортирует отложенные модули в фоне, пока пользователь вводит
+        логин и пароль; к нажатию "Войти" они обычно уже загружены."""
+
+        def run() -> None:
+            for name in _DEFERRED_MODULES:
+                __import__(name)
+
+        threading.Thread(target=run, name="prewarm", daemon=True).start()
 
     # -------------------- UI builders --------------------
 
@@ -108,7 +169,10 @@ class ArraySorterGUI:
         ttk.Button(actions, text="Проверить и разобрать", command=self._parse_from_entry).pack(
             side="left", padx=6
         )
+        ttk.Button(actions, text="Из буфера", command=self._paste_array).pack(side="left", padx=(0, 6))
+        ttk.Button(actions, text="Из файла...", command=self._load_file).pack(side="left", padx=(0, 6))
         ttk.Button(actions, text="Отсортировать", command=self._sort).pack(side="left", padx=6)
+        ttk.Button(actions, text="Отмена", command=self._cancel_task).pack(side="left")
         ttk.Button(actions, text="Очистить", command=self._clear_arrays).pack(side="right")
 
         # Блок вывода
@@ -116,12 +180,12 @@ class ArraySorterGUI:
         box_out.pack(fill="both", expand=True, padx=12, pady=(0, 10))
 
         ttk.Label(box_out, text="Исходный массив").pack(anchor="w")
-        self.src_text = tk.Text(box_out, height=4)
-        self.src_text.pack(fill="x", pady=(4, 10))
+        self.src_view = ArrayView(box_out, height=4)
+        self.src_view.pack(fill="x", pady=(4, 10))
 
         ttk.Label(box_out, text="Отсортированный массив (QuickSort)").pack(anchor="w")
-        self.dst_text = tk.Text(box_out, height=4)
-        self.dst_text.pack(fill="x", pady=(4, 10))
+        self.dst_view = ArrayView(box_out, height=4)
+        self.dst_view.pack(fill="x", pady=(4, 10))
 
         save_row = ttk.Frame(box_out)
         save_row.pack(fill="x")
@@ -146,11 +210,19 @@ class ArraySorterGUI:
         if not u or not p:
             messagebox.showwarning("Проверка", "Заполните логин и пароль")
             return
-        ok, msg = self.storage.register_user(u, p)
-        if ok:
-            messagebox.showinfo("Готово", msg)
-        else:
-            messagebox.showerror("Ошибка", msg)
+        if self._busy():
+            return
+
+        def done(result: tuple[bool, str]) -> None:
+            ok, msg = result
+            self.status.set("Готово")
+            if ok:
+                messagebox.showinfo("Готово", msg)
+            else:
+                messagebox.showerror("Ошибка", msg)
+
+        # Адаптивный хеш пароля занимает десятки миллисекунд - считаем в фоне.
+        self.tasks.submit("Регистрация", lambda task: self.auth.register(u, p), done, self._show_task_error)
 
     def _do_login(self) -> None:
         u = self.login_entry.get().strip()
@@ -159,18 +231,27 @@ class ArraySorterGUI:
             messagebox.showwarning("Проверка", "Заполните логин и пароль")
             return
 
-        ok, res = self.storage.authenticate_user(u, p)
-        if ok:
-            self.user = res
-            self.status.set(f"Вход выполнен: {self.user.username}")
-            self._build_main()
-        else:
-            messagebox.showerror("Ошибка", str(res))
+        if self._busy():
+            return
+
+        def done(result: tuple[bool, object]) -> None:
+            ok, res = result
+            if ok:
+                self.user = res
+                self.status.set(f"Вход выполнен: {self.user.username}")
+                self._build_main()
+            else:
+                self.status.set("Готово")
+                messagebox.showerror("Ошибка", str(res))
+
+        self.tasks.submit("Вход", lambda task: self.auth.authenticate(u, p), done, self._show_task_error)
 
     def _logout(self) -> None:
+        self.tasks.cancel()
         self.user = None
         self.src = []
         self.dst = None
+        self.base = None
         self.status.set("Вы вышли из аккаунта")
         self._build_login()
 
@@ -191,6 +272,7 @@ class ArraySorterGUI:
         n = random.randint(8, 20)
         self.src = [random.randint(-100, 100) for _ in range(n)]
         self.dst = None
+        self.base = None
         self.status.set(f"Сгенерирован массив из {n} элементов")
         self._render_arrays()
 
@@ -199,16 +281,20 @@ class ArraySorterGUI:
             messagebox.showinfo("Подсказка", "Переключите способ ввода на 'с клавиатуры'.")
             return False
 
-        raw = self.array_entry.get().strip()
-        if not raw:
+        raw = self.array_entry.get()
+        if not raw.strip():
             messagebox.showwarning("Проверка", "Введите числа через запятую")
             return False
 
         try:
-            parts = [p.strip() for p in raw.split(",") if p.strip()]
-            self.src = [int(x) for x in parts]
-        except ValueError:
-            messagebox.showerror("Ошибка", "Неверный формат. Пример: 1, -2, 3")
+            # Список, а не array('q'): в поле можно ввести и числа вне int64.
+            self.src = parse_array(raw, typecode=None)
+        except ArrayParseError as e:
+            # Поле однострочное - смещение токена совпадает с позицией в поле.
+            self.array_entry.focus_set()
+            self.array_entry.selection_range(e.offset, e.offset + len(e.token))
+            self.array_entry.icursor(e.offset)
+            messagebox.showerror("Ошибка", f"{e}\nПример: 1, -2, 3")
             return False
 
         if not self.src:
@@ -220,7 +306,80 @@ class ArraySorterGUI:
         self._render_arrays()
         return True
 
+    def _paste_array(self) -> None:
+        """Массив из буфера обмена: многострочный текст, минуя поле ввода."""
+        try:
+            text = self.root.clipboard_get()
+        except tk.TclError:
+            messagebox.showwarning("Проверка", "Буфер обмена пуст")
+            return
+        self._parse_in_background("Разбор вставленного текста", lambda progress: parse_array(text, None, progress))
+
+    def _load_file(self) -> None:
+        path = filedialog.askopenfilename(
+            title="Массив из файла", filetypes=[("Текст", "*.txt *.csv"), ("Все файлы", "*")]
+        )
+        if not path:
+            return
+        self._parse_in_background("Чтение файла", lambda progress: parse_array_file(path, None, progress))
+
+    def _parse_in_background(self, description: str, parse: Callable[[Callable[[int], None]], list[int]]) -> None:
+        if self._busy():
+            return
+
+        def work(task: Task) -> list[int]:
+            def progress(count: int) -> None:
+                task.check()
+                task.report(f"{count} чисел")
+
+            return parse(progress)
+
+        def done(result: list[int]) -> None:
+            if not result:
+                messagebox.showwarning("Проверка", "Массив пустой")
+                self.status.set("Готово")
+                return
+            # base (загруженную из истории запись) не сбрасываем: изменённый
+            # массив из буфера или файла сохраняется правкой относительно неё,
+            # а массив, отличающийся больше чем в восьмой части элементов
+            # (в том числе любой другой), diff_arrays отвергнет, и он
+            # сохранится целиком.
+            self.src = result
+            self.dst = None
+            # Миллионы чисел в однострочное поле не выводим: массив виден в
+            # окне просмотра, а поле остаётся для ручного ввода.
+            self.input_mode.set("manual")
+            self._sync_mode()
+            self.array_entry.delete(0, tk.END)
+            self.status.set(f"Массив принят: {len(result)} элементов")
+            self._render_arrays()
+
+        def failed(error: BaseException) -> None:
+            if isinstance(error, ArrayParseError):
+                self.status.set("Ошибка разбора")
+                messagebox.showerror("Ошибка", str(error))
+            else:
+                self._show_task_error(error)
+
+        self.tasks.submit(description, work, done, failed)
+
+    def _busy(self) -> bool:
+        if self.tasks.busy:
+            self.status.set("Дождитесь завершения текущей операции или нажмите 'Отмена'")
+            return True
+        return False
+
+    def _cancel_task(self) -> None:
+        if not self.tasks.cancel():
+            self.status.set("Нет выполняемых операций")
+
+    def _show_task_error(self, error: BaseException) -> None:
+        self.status.set("Ошибка")
+        messagebox.showerror("Ошибка", str(error))
+
     def _sort(self) -> None:
+        if self._busy():
+            return
         if not self.src:
             # если режим ручной, пробуем распарсить
             if self.input_mode.get() == "manual":
@@ -230,24 +389,45 @@ class ArraySorterGUI:
                 messagebox.showwarning("Проверка", "Сначала сгенерируйте массив")
                 return
 
-        self.dst = quick_sort(self.src)
-        self.status.set("Сортировка завершена")
-        self._render_arrays()
+        src, base = self.src, self.base
+        n = len(src)
+
+        def work(task: Task) -> list[int]:
+            from array_delta import diff_arrays
+
+            if base is not None and base[2] is not None:
+                # Массив из истории изменён немного - обновляем его
+                # отсортированную версию вместо полной сортировки.
+                delta = diff_arrays(base[1], src)
+                if delta is not None:
+                    return delta.apply_sorted(base[2])
+
+            def progress(done: int) -> None:
+                task.check()  # TaskCancelled прерывает сортировку
+                task.report(f"{done * 100 // n}%")
+
+            return self.sort_cache.sort(src, progress=progress)
+
+        def done(result: list[int]) -> None:
+            if src is not self.src:
+                return  # пока шла сортировка, массив заменили
+            self.dst = result
+            self.status.set("Сортировка завершена")
+            self._render_arrays()
+
+        self.tasks.submit(f"Сортировка {n} элементов", work, done, self._show_task_error)
 
     def _clear_arrays(self) -> None:
         self.src = []
         self.dst = None
+        self.base = None
         self.status.set("Данные очищены")
         self._render_arrays()
 
     def _render_arrays(self) -> None:
-        self.src_text.delete("1.0", tk.END)
-        self.dst_text.delete("1.0", tk.END)
-
-        if self.src:
-            self.src_text.insert(tk.END, str(self.src))
-        if self.dst is not None:
-            self.dst_text.insert(tk.END, str(self.dst))
+        # Виджеты форматируют только видимую часть массива.
+        self.src_view.set_values(self.src)
+        self.dst_view.set_values(self.dst)
 
     # -------------------- DB actions --------------------
 
@@ -258,54 +438,97 @@ class ArraySorterGUI:
         if not self.src:
             messagebox.showwarning("Проверка", "Нет массива для сохранения")
             return
+        if self._busy():
+            return
 
-        ok, msg = self.storage.save_arrays(self.user.id, self.src, self.dst)
-        if ok:
-            self.status.set("Сохранено")
-            messagebox.showinfo("Готово", msg)
-        else:
-            messagebox.showerror("Ошибка", msg)
+        user_id, src, dst, base = self.user.id, self.src, self.dst, self.base
+
+        def work(task: Task) -> tuple[bool, str]:
+            from array_delta import diff_arrays
+
+            if base is not None and (dst is None or base[2] is not None):
+                # Правку записи из истории сохраняем разностью.
+                delta = diff_arrays(base[1], src)
+                if delta is not None:
+                    return self.storage.save_array_delta(user_id, base[0], delta, with_sorted=dst is not None)
+            return self.storage.save_arrays(user_id, src, dst)
+
+        def done(result: tuple[bool, str]) -> None:
+            ok, msg = result
+            if ok:
+                self.status.set("Сохранено")
+                messagebox.showinfo("Готово", msg)
+            else:
+                self.status.set("Ошибка сохранения")
+                messagebox.showerror("Ошибка", msg)
+
+        self.tasks.submit("Сохранение", work, done, self._show_task_error)
 
     def _open_history(self) -> None:
         if not self.user:
             return
 
-        ok, res = self.storage.list_user_arrays(self.user.id)
-        if not ok:
-            messagebox.showerror("Ошибка", str(res))
-            return
+        user_id = self.user.id
+
+        # Выполняются в фоновом потоке (BackgroundRunner.fetch) - к виджетам
+        # не обращаются, об ошибке сообщают исключением.
+        def fetch_page(after_id: int | None, limit: int) -> list[dict]:
+            ok, res = self.storage.list_user_arrays(user_id, after_id=after_id, limit=limit)
+            if not ok:
+                raise RuntimeError(res)
+            return res
+
+        def fetch_item(array_id: int) -> dict:
+            ok, res = self.storage.get_user_array(user_id, array_id)
+            if not ok:
+                raise RuntimeError(res)
+            return res
+
+        def fetch_preview(array_id: int) -> dict:
+            ok, res = self.storage.get_array_preview(user_id, array_id, limit=PREVIEW_LIMIT)
+            if not ok:
+                raise RuntimeError(res)
+            return res
 
         win = tk.Toplevel(self.root)
         win.title("История сохранений")
         win.geometry("900x420")
 
-        tree = ttk.Treeview(win, columns=("id", "len", "created", "orig", "sorted"), show="headings")
-        tree.heading("id", text="ID")
-        tree.heading("len", text="Размер")
-        tree.heading("created", text="Дата")
-        tree.heading("orig", text="Исходный")
-        tree.heading("sorted", text="Отсортированный")
-
-        tree.column("id", width=60, anchor="center")
-        tree.column("len", width=70, anchor="center")
-        tree.column("created", width=150)
-        tree.column("orig", width=280)
-        tree.column("sorted", width=280)
-
-        for item in res:
-            tree.insert(
-                "",
-                "end",
-                values=(
-                    item["id"],
-                    item["length"],
-                    item["created_at"],
-                    str(item["original"]),
-                    str(item["sorted"]) if item["sorted"] is not None else "-",
-                ),
-            )
-
-        tree.pack(fill="both", expand=True, padx=10, pady=10)
+        # Записи подгружаются страницами по мере прокрутки, массивы -
+        # только для выбранной строки (для превью - только их начало).
+        table = HistoryTable(
+            win,
+            fetch_page,
+            fetch_item,
+            on_open=self._load_from_history,
+            fetch_preview=fetch_preview,
+            run_async=self.tasks.fetch,
+        )
+        table.pack(fill="both", expand=True, padx=10, pady=10)
+
+        def on_loaded(_event: tk.Event) -> None:
+            more = "" if table.exhausted else "+"
+            win.title(f"История сохранений ({table.loaded}{more})")
+
+        table.bind("<<HistoryLoaded>>", on_loaded)
+        table.bind("<<HistoryError>>", lambda _event: self.status.set(str(table.last_error)))
+        on_loaded(None)
+
+    def _load_from_history(self, item: dict) -> None:
+        if self._busy():
+            return
+        self.src = list(item["original"])
+        self.dst = list(item["sorted"]) if item["sorted"] is not None else None
+        self.base = (item["id"], self.src, self.dst)
+        self.input_mode.set("manual")
+        self._sync_mode()
+        # Массив виден в окне просмотра; в однострочное поле его не выводим.
+        # Изменённый массив можно ввести в поле или вставить из буфера.
+        self.array_entry.delete(0, tk.END)
+        self.status.set(
+            f"Загружена запись #{item['id']} ({len(self.src)} эл.) - введите или вставьте изменённый массив"
+        )
+        self._render_arrays()
 
     # -------------------- Help --------------------
 
@@ -314,17 +537,71 @@ class ArraySorterGUI:
             "Как работать с программой:\n\n"
             "1) Создайте аккаунт или войдите.\n"
             "2) Выберите способ ввода массива: ручной или генерация.\n"
-            "3) Для ручного ввода: числа через запятую (например: 3, -1, 0).\n"
+            "3) Для ручного ввода: числа через запятую или пробел (например: 3, -1, 0).\n"
+            "   Большие массивы можно вставить кнопкой 'Из буфера' или загрузить 'Из файла...'.\n"
             "4) Нажмите 'Отсортировать' - используется QuickSort (лаб. 2).\n"
-            "5) Кнопка 'Сохранить' записывает массивы в БД, а 'История' показывает сохранения.\n\n"
+            "5) Кнопка 'Сохранить' записывает массивы в БД, а 'История' показывает сохранения.\n"
+            "6) Двойной щелчок по записи истории загружает её для правки: после небольших\n"
+            "   изменений сортировка и сохранение выполняются только для изменённых элементов.\n\n"
             "Если ввод некорректен - программа подсветит проблему через сообщение об ошибке."
         )
         messagebox.showinfo("Справка", txt)
 
 
-def main() -> None:
+def startup_report(marks: list[tuple[str, float]], top: int = 15) -> str:
+    """Отчёт о запуске: этапы (от загрузки модуля lab3_app) и самые долгие
+    импорты по данным `python -X importtime` в отдельном процессе."""
+    import subprocess
+
+    lines = ["Этапы запуска, мс:"]
+    for name, at in marks:
+        lines.append(f"  {(at - _STARTED_AT) * 1000:8.1f}  {name}")
+
+    for label, modules in (("при запуске", "lab3_app"), ("отложенные", ",".join(_DEFERRED_MODULES))):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import lab3_app, {modules}"],
+            capture_output=True,
+            text=True,
+        )
+        rows = []
+        for line in proc.stderr.splitlines():
+            # "import time: self [us] | cumulative | imported package"
+            parts = line.removeprefix("import time:").split("|")
+            if len(parts) == 3 and parts[0].strip().isdigit():
+                rows.append((int(parts[1]), int(parts[0]), parts[2].strip()))
+        lines.append(f"Импорты ({label}), мс: всего / собственное время")
+        for cumulative, own, name in sorted(rows, reverse=True)[:top]:
+            lines.append(f"  {cumulative / 1000:8.1f} {own / 1000:8.1f}  {name}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    report = "--startup-report" in argv
+    marks = [("вызов main()", perf_counter())]
+
     root = tk.Tk()
-    ArraySorterGUI(root)
+    marks.append(("tk.Tk()", perf_counter()))
+    app = ArraySorterGUI(root)
+    marks.append(("окно входа построено", perf_counter()))
+
+    def on_close() -> None:
+        app.tasks.shutdown()
+        # Сервисы создаются при первом обращении - закрываем только созданные.
+        if "auth" in app.__dict__:
+            app.auth.close()
+        root.destroy()
+
+    if report:
+
+        def on_idle() -> None:
+            marks.append(("первый простой цикла событий", perf_counter()))
+            print(startup_report(marks))
+            on_close()
+
+        root.after_idle(on_idle)
+
+    root.protocol("WM_DELETE_WINDOW", on_close)
     root.mainloop()
 
 
@@ -0,0 +1,223 @@
+"""Метрики горячих путей: задержки, счётчики, ошибки и размеры массивов.
+
+Сбор включается переменной окружения SORT_APP_METRICS=1 и настраивается при
+импорте: если метрики выключены, декоратор instrument возвращает функцию без
+изменений, и накладных расходов нет совсем.
+
+Каждый поток пишет в собственные счётчики без блокировок; snapshot()
+складывает их. Вызов инструментированной функции изнутри другой (например,
+quick_sort из sort_array) учитывается под именем "родитель/операция", так
+что у каждой операции верхнего уровня ровно одна запись на вызов. Снимок
+доступен как dict/JSON и в текстовом формате Prometheus.
+"""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import json
+import os
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+ENABLED = os.environ.get("SORT_APP_METRICS", "").lower() in ("1", "true", "yes", "on")
+
+# Верхние границы корзин гистограмм (последняя корзина - всё, что больше).
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+SIZE_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class _OpStats:
+    __slots__ = ("count", "errors", "seconds", "rows", "elements", "bytes", "latency", "sizes")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.elements = 0
+        self.bytes = 0
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sizes = [0] * (len(SIZE_BUCKETS) + 1)
+
+
+_local = threading.local()
+_stores: List[Dict[str, _OpStats]] = []
+_stores_lock = threading.Lock()
+
+
+def _thread_store() -> Dict[str, _OpStats]:
+    store = getattr(_local, "store", None)
+    if store is None:
+        store = {}
+        _local.store = store
+        with _stores_lock:  # только при первом обращении потока
+            _stores.append(store)
+    return store
+
+
+def _call_stack() -> List[str]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _is_error(result: Any) -> bool:
+    # SqliteStorage сообщает об ошибках значением False или кортежем (False, сообщение).
+    if result is False:
+        return True
+    return isinstance(result, tuple) and len(result) == 2 and result[0] is False
+
+
+def record(
+    name: str,
+    seconds: float,
+    error: bool = False,
+    rows: int = 0,
+    array_size: Optional[int] = None,
+) -> None:
+    """Учитывает одну операцию (для ручной инструментовки)."""
+    store = _thread_store()
+    op = store.get(name)
+    if op is None:
+        op = store[name] = _OpStats()
+    op.count += 1
+    op.seconds += seconds
+    op.latency[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    if error:
+        op.errors += 1
+    op.rows += rows
+    if array_size is not None:
+        op.elements += array_size
+        op.bytes += 8 * array_size
+        op.sizes[bisect_left(SIZE_BUCKETS, array_size)] += 1
+
+
+def instrument(
+    name: str,
+    array_arg: Optional[str] = None,
+    rows: Optional[Callable[[Any], int]] = None,
+) -> Callable[[F], F]:
+    """Декоратор: задержка, количество вызовов и ошибок операции name.
+
+    array_arg - имя аргумента с массивом (учитываются размер и объём данных),
+    rows - функция, вычисляющая по результату число обработанных строк.
+    """
+
+    def decorator(fn: F) -> F:
+        if not ENABLED:
+            return fn
+
+        index = None
+        if array_arg is not None:
+            index = list(inspect.signature(fn).parameters).index(array_arg)
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            stack = _call_stack()
+            key = f"{stack[-1]}/{name}" if stack else name
+            stack.append(key)
+            t0 = perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                record(key, perf_counter() - t0, error=True)
+                raise
+            finally:
+                stack.pop()
+            elapsed = perf_counter() - t0
+
+            size = None
+            if index is not None:
+                values = args[index] if index < len(args) else kwargs.get(array_arg)
+                if values is not None:
+                    size = len(values)
+            error = _is_error(result)
+            record(key, elapsed, error, rows(result) if rows and not error else 0, size)
+            return result
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """Сумма счётчиков всех потоков по каждой операции."""
+    with _stores_lock:
+        stores = list(_stores)
+    merged: Dict[str, _OpStats] = {}
+    for store in stores:
+        for name, op in list(store.items()):
+            acc = merged.get(name)
+            if acc is None:
+                acc = merged[name] = _OpStats()
+            acc.count += op.count
+            acc.errors += op.errors
+            acc.seconds += op.seconds
+            acc.rows += op.rows
+            acc.elements += op.elements
+            acc.bytes += op.bytes
+            acc.latency = [a + b for a, b in zip(acc.latency, op.latency)]
+            acc.sizes = [a + b for a, b in zip(acc.sizes, op.sizes)]
+
+    return {
+        name: {
+            "count": op.count,
+            "errors": op.errors,
+            "seconds_total": op.seconds,
+            "rows": op.rows,
+            "elements": op.elements,
+            "bytes": op.bytes,
+            "latency_buckets": dict(zip([*map(str, LATENCY_BUCKETS), "+Inf"], op.latency)),
+            "size_buckets": dict(zip([*map(str, SIZE_BUCKETS), "+Inf"], op.sizes)),
+        }
+        for name, op in sorted(merged.items())
+    }
+
+
+def to_json() -> str:
+    return json.dumps(snapshot(), ensure_ascii=False, indent=2)
+
+
+def to_prometheus(prefix: str = "sort_app") -> str:
+    """Снимок в текстовом формате экспозиции Prometheus."""
+    lines: List[str] = []
+    data = snapshot()
+
+    def counter(metric: str, help_text: str, key: str) -> None:
+        lines.append(f"# HELP {prefix}_{metric} {help_text}")
+        lines.append(f"# TYPE {prefix}_{metric} counter")
+        for name, op in data.items():
+            lines.append(f'{prefix}_{metric}{{op="{name}"}} {op[key]}')
+
+    counter("errors_total", "Operations that returned an error.", "errors")
+    counter("rows_total", "Rows processed.", "rows")
+    counter("elements_total", "Array elements processed.", "elements")
+    counter("bytes_total", "Array payload bytes processed (8 bytes per element).", "bytes")
+
+    for metric, help_text, key, total_key in (
+        ("op_duration_seconds", "Operation latency.", "latency_buckets", "seconds_total"),
+        ("array_size", "Array size distribution.", "size_buckets", "elements"),
+    ):
+        lines.append(f"# HELP {prefix}_{metric} {help_text}")
+        lines.append(f"# TYPE {prefix}_{metric} histogram")
+        for name, op in data.items():
+            cumulative = 0
+            for le, n in op[key].items():
+                cumulative += n
+                lines.append(f'{prefix}_{metric}_bucket{{op="{name}",le="{le}"}} {cumulative}')
+            count = op["count"] if key == "latency_buckets" else cumulative
+            lines.append(f'{prefix}_{metric}_sum{{op="{name}"}} {op[total_key]}')
+            lines.append(f'{prefix}_{metric}_count{{op="{name}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    with _stores_lock:
+        for store in _stores:
+            store.clear()
@@ -5,28 +5,735 @@
 
 from __future__ import annotations
 
-from typing import List
+import heapq
+import operator
+import os
+import random
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass
+from itertools import islice
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
+from metrics import instrument
 
-def quick_sort(values: List[int]) -> List[int]:
-    """Функциональная реализация быстрой сортировки.
+if TYPE_CHECKING:
+    from multiprocessing import shared_memory
 
-    Возвращает новый список, не изменяя исходный.
+try:  # NumPy необязателен: без него используется встроенная сортировка
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+INT64_MIN = -(2**63)
+INT64_MAX = 2**63 - 1
+
+# Отрезки короче этого порога досортировываются вставками.
+INSERTION_CUTOFF = 16
+# Для отрезков длиннее этого порога опорный элемент выбирается как "ninther".
+NINTHER_CUTOFF = 128
+# Пороги адаптивной сортировки (см. choose_sort_path).
+ADAPTIVE_SMALL = 64
+RADIX_MIN_SIZE = 4096
+RADIX_MAX_BITS = 44
+RADIX_BITS = 11
+_NATIVE_ORDER = "<" if sys.byteorder == "little" else ">"
+
+# Массивы короче этого порога parallel_sort сортирует в одном процессе.
+PARALLEL_MIN_SIZE = 1 << 20
+
+
+class SortCancelled(Exception):
+    """Сортировка прервана из обратного вызова progress."""
+
+
+@instrument("sort.quick_sort", array_arg="values")
+def quick_sort(values: List[int], progress: Optional[Callable[[int], None]] = None) -> List[int]:
+    """Быстрая сортировка (introsort).
+
+    Возвращает новый список, не изменяя исходный. progress - см. introsort.
+    """
+    result = list(values)
+    introsort(result, progress=progress)
+    return result
+
+
+def fits_int64(values: Iterable[int]) -> bool:
+    """Проверяет, что все значения помещаются в знаковое 64-битное целое."""
+    lo = min(values, default=0)
+    hi = max(values, default=0)
+    return INT64_MIN <= lo and hi <= INT64_MAX
+
+
+def _int64_data(values: Sequence[int]) -> Any:
+    """values как буфер int64 (numpy.ndarray или array('q')) или None, если
+    среди значений есть нецелые (например, float) или вне диапазона int64."""
+    if np is not None and isinstance(values, np.ndarray):
+        return values if values.ndim == 1 and np.can_cast(values.dtype, np.int64) else None
+    if isinstance(values, array) and values.typecode == "q":
+        return values
+    try:
+        return array("q", values)
+    except (TypeError, OverflowError):
+        return None
+
+
+@instrument("sort.sort_array", array_arg="values")
+def sort_array(values: Any) -> Any:
+    """Векторизованная сортировка типизированных массивов.
+
+    Принимает array.array, memoryview, numpy.ndarray или список и возвращает
+    новый отсортированный контейнер того же типа. Типизированные данные
+    сортируются NumPy прямо в буфере, без промежуточного списка Python.
+    Если NumPy не установлен, используется встроенная sorted().
+    Списки со значениями вне int64 или нецелыми значениями сортируются через
+    quick_sort. memoryview в формате с явным порядком байт (например, "<q")
+    возвращается в родном формате.
     """
-    if len(values) <= 1:
+    if np is not None and isinstance(values, np.ndarray):
+        if values.dtype == object:
+            # Произвольная точность: сортируем как обычные целые Python.
+            return np.array(quick_sort(values.tolist()), dtype=object)
+        return np.sort(values, kind="stable")
+
+    if isinstance(values, array):
+        out = array(values.typecode, values)
+        if np is not None:
+            np.frombuffer(out, dtype=out.typecode).sort(kind="stable")
+        else:
+            out = array(values.typecode, sorted(values))
+        return out
+
+    if isinstance(values, memoryview):
+        order = values.format[:1]
+        data = array(values.format.lstrip("@=<>!"), values.tobytes())
+        if order in "<>!" and order.replace("!", ">") != _NATIVE_ORDER:
+            data.byteswap()
+        return memoryview(sort_array(data))
+
+    if np is not None and values:
+        data = _int64_data(values)
+        if data is not None:
+            np.frombuffer(data, dtype=np.int64).sort(kind="stable")
+            return data.tolist()
+    return quick_sort(values)
+
+
+@dataclass(frozen=True)
+class ArrayProfile:
+    """Характеристики массива, по которым выбирается алгоритм сортировки."""
+
+    size: int
+    min_value: int
+    max_value: int
+    descents: int  # число мест, где a[i] > a[i+1]
+    ascents: int  # число мест, где a[i] < a[i+1]
+    duplicates_ratio: float  # оценка доли повторов по выборке
+
+    @property
+    def span(self) -> int:
+        return self.max_value - self.min_value
+
+
+def profile_array(values: Sequence[int], sample_size: int = 1024) -> ArrayProfile:
+    """Профилирует массив.
+
+    Это четыре прохода (спуски, подъёмы, min, max), но каждый выполняется
+    встроенными функциями на уровне C, что быстрее одного прохода циклом
+    Python; доля повторов оценивается по выборке из sample_size элементов.
+    """
+    n = len(values)
+    if n == 0:
+        return ArrayProfile(0, 0, 0, 0, 0, 0.0)
+    descents = sum(map(operator.gt, values, islice(values, 1, None)))
+    ascents = sum(map(operator.lt, values, islice(values, 1, None)))
+    step = max(1, n // sample_size)
+    sample = values[::step] if isinstance(values, (list, array)) else list(values)[::step]
+    duplicates_ratio = 1.0 - len(set(sample)) / len(sample)
+    return ArrayProfile(n, min(values), max(values), descents, ascents, duplicates_ratio)
+
+
+def choose_sort_path(profile: ArrayProfile) -> str:
+    """Выбирает алгоритм для массива с данным профилем.
+
+    "sorted"/"reversed" - массив уже упорядочен, "small" - короткий массив,
+    "counting" - диапазон значений не больше удвоенного размера, "runs" -
+    несколько длинных упорядоченных серий (естественное слияние),
+    "few_unique" - много повторов (сортируются только различные значения),
+    "radix" - большой массив с ограниченным диапазоном, "introsort" - всё
+    остальное.
+    """
+    n = profile.size
+    if profile.descents == 0:
+        return "sorted"
+    if profile.ascents == 0:
+        return "reversed"
+    if n <= ADAPTIVE_SMALL:
+        return "small"
+    if profile.span < 2 * n:
+        return "counting"
+    if profile.descents < max(2, n // 256):
+        return "runs"
+    if profile.duplicates_ratio >= 0.5:
+        return "few_unique"
+    if n >= RADIX_MIN_SIZE and profile.span.bit_length() <= RADIX_MAX_BITS:
+        return "radix"
+    return "introsort"
+
+
+_adaptive_counts: Counter = Counter()
+_adaptive_lock = threading.Lock()
+
+
+@instrument("sort.adaptive_sort", array_arg="values")
+def adaptive_sort(values: Sequence[int]) -> List[int]:
+    """Сортировка с выбором алгоритма по профилю входных данных.
+
+    Возвращает новый список. Выбранный путь учитывается в adaptive_stats().
+    """
+    profile = profile_array(values)
+    path = choose_sort_path(profile) if profile.size else "sorted"
+    with _adaptive_lock:
+        _adaptive_counts[path] += 1
+
+    if path == "sorted":
         return list(values)
+    if path == "reversed":
+        return list(reversed(values))
+    if path == "counting":
+        return _counting_sort(values, profile.min_value, profile.span)
+    if path == "runs":
+        return _natural_merge_sort(values)
+    if path == "few_unique":
+        counts = Counter(values)
+        keys = list(counts)
+        introsort(keys)
+        result: List[int] = []
+        for k in keys:
+            result += [k] * counts[k]
+        return result
+    if path == "radix":
+        return _radix_sort(values, profile.min_value, profile.span)
+    return quick_sort(values)
+
 
-    pivot = values[len(values) // 2]
-    less: List[int] = []
-    equal: List[int] = []
-    greater: List[int] = []
+def adaptive_stats() -> Dict[str, int]:
+    """Сколько раз adaptive_sort выбрал каждый из путей."""
+    with _adaptive_lock:
+        return dict(_adaptive_counts)
 
+
+def _counting_sort(values: Sequence[int], lo: int, span: int) -> List[int]:
+    counts = [0] * (span + 1)
     for x in values:
+        counts[x - lo] += 1
+    result: List[int] = []
+    for i, c in enumerate(counts):
+        if c:
+            result += [i + lo] * c
+    return result
+
+
+def _radix_sort(values: Sequence[int], lo: int, span: int) -> List[int]:
+    """LSD-поразрядная сортировка неотрицательных смещений x - lo."""
+    mask = (1 << RADIX_BITS) - 1
+    data = [x - lo for x in values]
+    for shift in range(0, span.bit_length(), RADIX_BITS):
+        buckets: List[List[int]] = [[] for _ in range(mask + 1)]
+        for x in data:
+            buckets[(x >> shift) & mask].append(x)
+        data = [x for b in buckets for x in b]
+    return [x + lo for x in data]
+
+
+def _natural_merge_sort(values: Sequence[int]) -> List[int]:
+    """Слияние готовых неубывающих серий, попарно снизу вверх."""
+    runs: List[List[int]] = []
+    start = 0
+    n = len(values)
+    for i in range(1, n + 1):
+        if i == n or values[i] < values[i - 1]:
+            runs.append(list(values[start:i]))
+            start = i
+    while len(runs) > 1:
+        merged = [_merge(runs[i], runs[i + 1]) for i in range(0, len(runs) - 1, 2)]
+        if len(runs) % 2:
+            merged.append(runs[-1])
+        runs = merged
+    return runs[0]
+
+
+def _merge(a: List[int], b: List[int]) -> List[int]:
+    result: List[int] = []
+    i = j = 0
+    na, nb = len(a), len(b)
+    while i < na and j < nb:
+        if b[j] < a[i]:
+            result.append(b[j])
+            j += 1
+        else:
+            result.append(a[i])
+            i += 1
+    result += a[i:]
+    result += b[j:]
+    return result
+
+
+def merge_sorted_delta(
+    sorted_values: Sequence[int],
+    removed: Iterable[int] = (),
+    added: Iterable[int] = (),
+) -> List[int]:
+    """Пересортировка после небольшой правки массива без полной сортировки.
+
+    Из отсортированного sorted_values удаляются значения removed (по одному
+    вхождению на каждое) и вставляются значения added. Позиции ищутся
+    двоичным поиском в исходном массиве (O(k log n) сравнений при k
+    изменённых элементах), после чего результат собирается за один проход
+    из срезов между этими позициями. Копирование n элементов неизбежно -
+    возвращается новый список, - но выполняется срезами на уровне C, без
+    сдвига списка на каждую правку.
+    """
+    removed = sorted(removed)
+    added = sorted(added)
+    cuts: List[int] = []  # индексы удаляемых элементов, по возрастанию
+    lo = 0
+    for x in removed:
+        i = bisect_left(sorted_values, x, lo)
+        if i == len(sorted_values) or sorted_values[i] != x:
+            raise ValueError(f"Значение {x} отсутствует в отсортированном массиве")
+        cuts.append(i)
+        lo = i + 1
+    inserts = [bisect_right(sorted_values, y) for y in added]
+
+    result: List[int] = []
+    pos = ri = ai = 0
+    while ri < len(cuts) or ai < len(inserts):
+        if ri == len(cuts) or (ai < len(inserts) and inserts[ai] <= cuts[ri]):
+            # Вставка перед элементом inserts[ai].
+            result.extend(sorted_values[pos : inserts[ai]])
+            pos = inserts[ai]
+            result.append(added[ai])
+            ai += 1
+        else:
+            result.extend(sorted_values[pos : cuts[ri]])
+            pos = cuts[ri] + 1
+            ri += 1
+    result.extend(sorted_values[pos:])
+    return result
+
+
+def sort_many(
+    arrays: Iterable[Sequence[int]],
+    workers: Optional[int] = None,
+    chunk_size: int = 64,
+    shm_threshold: int = 1 << 16,
+    ordered: bool = True,
+) -> Iterator[Any]:
+    """Сортирует много массивов параллельно в пуле процессов.
+
+    Небольшие массивы группируются по chunk_size штук в одну задачу, чтобы
+    снизить накладные расходы на межпроцессный обмен. Массивы длиной от
+    shm_threshold передаются через разделяемую память и сортируются на месте
+    без сериализации. Одновременно в работе держится не более 2*workers задач,
+    поэтому входной итератор читается по мере обработки.
+
+    При ordered=True результаты выдаются в порядке входа, иначе - по мере
+    готовности в виде пар (индекс, отсортированный массив).
+    """
+    # Пул процессов и разделяемая память нужны только здесь; импорт
+    # multiprocessing заметно удлиняет запуск приложения.
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import resource_tracker, shared_memory
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = 2 * workers
+    if os.name == "posix":
+        # Трекер запускается до старта воркеров, чтобы они использовали общий
+        # трекер и не считали сегменты разделяемой памяти "утёкшими".
+        resource_tracker.ensure_running()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # future -> (индекс первого массива, разделяемая память, длина)
+        pending: Dict[Future, Tuple[int, Optional[shared_memory.SharedMemory], int]] = {}
+        ready: Dict[int, List[int]] = {}
+        next_index = 0
+
+        def drain() -> Iterator[Any]:
+            nonlocal next_index
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                start, shm, n = pending.pop(fut)
+                if shm is None:
+                    results = fut.result()
+                else:
+                    results = [_collect_shared(fut, shm, n)]
+                for offset, res in enumerate(results):
+                    if ordered:
+                        ready[start + offset] = res
+                    else:
+                        yield start + offset, res
+            while next_index in ready:
+                yield ready.pop(next_index)
+                next_index += 1
+
+        try:
+            chunk: List[Sequence[int]] = []
+            chunk_start = 0
+            index = 0
+            for arr in arrays:
+                data = _int64_data(arr) if len(arr) >= shm_threshold else None
+                if data is not None:
+                    if chunk:
+                        pending[pool.submit(_sort_chunk, chunk)] = (chunk_start, None, 0)
+                        chunk = []
+                    shm = _to_shared(data)
+                    pending[pool.submit(_sort_shared, shm.name, len(arr))] = (index, shm, len(arr))
+                else:
+                    if not chunk:
+                        chunk_start = index
+                    chunk.append(arr)
+                    if len(chunk) >= chunk_size:
+                        pending[pool.submit(_sort_chunk, chunk)] = (chunk_start, None, 0)
+                        chunk = []
+                index += 1
+
+                while len(pending) >= max_pending:
+                    yield from drain()
+
+            if chunk:
+                pending[pool.submit(_sort_chunk, chunk)] = (chunk_start, None, 0)
+            while pending:
+                yield from drain()
+        finally:
+            # Генератор могли не дочитать: освобождаем оставшиеся сегменты.
+            for _, shm, _ in pending.values():
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+
+
+def _sort_chunk(chunk: List[Sequence[int]]) -> List[List[int]]:
+    return [sort_array(list(arr)) for arr in chunk]
+
+
+def _to_shared(values: Sequence[int]) -> shared_memory.SharedMemory:
+    from multiprocessing import shared_memory
+
+    if np is not None and isinstance(values, np.ndarray):
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(values) * 8))
+        np.ndarray((len(values),), dtype=np.int64, buffer=shm.buf)[:] = values
+        return shm
+    data = values if isinstance(values, array) and values.typecode == "q" else array("q", values)
+    shm = shared_memory.SharedMemory(create=True, size=len(data) * data.itemsize)
+    shm.buf[: len(data) * data.itemsize] = memoryview(data).cast("B")
+    return shm
+
+
+def _sort_shared(name: str, n: int) -> None:
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        if np is not None:
+            data = np.ndarray((n,), dtype=np.int64, buffer=shm.buf)
+            data.sort()
+            del data
+        else:
+            view = shm.buf[: n * 8].cast("q")
+            view[:] = array("q", sorted(view))
+            view.release()
+    finally:
+        shm.close()
+
+
+def _collect_shared(fut: Future, shm: shared_memory.SharedMemory, n: int) -> List[int]:
+    try:
+        fut.result()
+        view = shm.buf[: n * 8].cast("q")
+        result = view.tolist()
+        view.release()
+        return result
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def parallel_sort(
+    values: Sequence[int],
+    workers: Optional[int] = None,
+    threshold: int = PARALLEL_MIN_SIZE,
+    oversample: int = 32,
+) -> Any:
+    """Параллельная сортировка одного большого массива (sample sort).
+
+    Массив копируется в разделяемую память и делится на workers частей;
+    каждый процесс сортирует свою часть на месте и считает, сколько её
+    элементов попадает в каждую из корзин, заданных разделителями из
+    случайной выборки. Затем каждый процесс собирает свою корзину из отрезков
+    всех частей во второй сегмент и досортировывает её (отрезки уже
+    упорядочены, поэтому сортировка сводится к слиянию). Данные между
+    процессами не сериализуются - передаются только имена сегментов и границы.
+
+    Массивы короче threshold, а также значения вне int64 сортируются в
+    текущем процессе через sort_array. Тип результата - как у sort_array.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import resource_tracker, shared_memory
+
+    workers = workers or os.cpu_count() or 1
+    n = len(values)
+    if workers < 2 or n < max(threshold, 2 * workers):
+        return sort_array(values)
+    data = _int64_data(values)
+    if data is None:
+        return sort_array(values)
+    if os.name == "posix":
+        resource_tracker.ensure_running()  # см. sort_many
+
+    src = _to_shared(data)
+    dst = shared_memory.SharedMemory(create=True, size=n * 8)
+    try:
+        view = src.buf[: n * 8].cast("q")
+        rng = random.Random(n)
+        sample = sorted(view[rng.randrange(n)] for _ in range(workers * oversample))
+        view.release()
+        splitters = [sample[i * oversample] for i in range(1, workers)]
+        bounds = [n * i // workers for i in range(workers + 1)]
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # cuts[p][b] - начало корзины b внутри отсортированной части p.
+            cuts = list(
+                pool.map(_sort_partition, [src.name] * workers, bounds[:-1], bounds[1:], [splitters] * workers)
+            )
+            sizes = [sum(c[b + 1] - c[b] for c in cuts) for b in range(workers)]
+            offsets = [0]
+            for size in sizes:
+                offsets.append(offsets[-1] + size)
+            segments = [[(c[b], c[b + 1]) for c in cuts] for b in range(workers)]
+            list(pool.map(_merge_bucket, [src.name] * workers, [dst.name] * workers, segments, offsets[:-1]))
+
+        out = dst.buf[: n * 8].cast("q")
+        try:
+            if np is not None and isinstance(values, np.ndarray):
+                return np.frombuffer(out, dtype=np.int64).astype(values.dtype)
+            if isinstance(values, array):
+                return array(values.typecode, out)
+            return out.tolist()
+        finally:
+            out.release()
+    finally:
+        for shm in (src, dst):
+            shm.close()
+            shm.unlink()
+
+
+def _sort_partition(name: str, lo: int, hi: int, splitters: List[int]) -> List[int]:
+    """Сортирует отрезок [lo, hi) сегмента на месте и возвращает абсолютные
+    границы корзин внутри него (len(splitters) + 2 значения)."""
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        if np is not None:
+            data = np.ndarray((hi - lo,), dtype=np.int64, buffer=shm.buf, offset=lo * 8)
+            data.sort()
+            cuts = (data.searchsorted(splitters, side="right") + lo).tolist()
+            del data
+        else:
+            view = shm.buf[lo * 8 : hi * 8].cast("q")
+            part = sorted(view)
+            view[:] = array("q", part)
+            view.release()
+            cuts = [bisect_right(part, s) + lo for s in splitters]
+        return [lo] + cuts + [hi]
+    finally:
+        shm.close()
+
+
+def _merge_bucket(src_name: str, dst_name: str, segments: List[Tuple[int, int]], offset: int) -> None:
+    from multiprocessing import shared_memory
+
+    src = shared_memory.SharedMemory(name=src_name)
+    dst = shared_memory.SharedMemory(name=dst_name)
+    try:
+        size = sum(hi - lo for lo, hi in segments)
+        if np is not None:
+            a = np.ndarray((src.size // 8,), dtype=np.int64, buffer=src.buf)
+            out = np.ndarray((size,), dtype=np.int64, buffer=dst.buf, offset=offset * 8)
+            pos = 0
+            for lo, hi in segments:
+                out[pos : pos + hi - lo] = a[lo:hi]
+                pos += hi - lo
+            # Устойчивая сортировка NumPy для int64 - timsort: уже
+            # упорядоченные отрезки она сливает за линейное время.
+            out.sort(kind="stable")
+            del a, out
+        else:
+            a = src.buf.cast("q")
+            merged = array("q", heapq.merge(*(a[lo:hi] for lo, hi in segments)))
+            a.release()
+            dst.buf[offset * 8 : (offset + size) * 8] = memoryview(merged).cast("B")
+    finally:
+        src.close()
+        dst.close()
+
+
+def introsort(
+    a: MutableSequence[int],
+    lo: int = 0,
+    hi: int | None = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> None:
+    """Сортирует a[lo:hi] на месте.
+
+    Итеративная быстрая сортировка с явным стеком: трёхпутевое разбиение,
+    медиана трёх / ninther в качестве опорного элемента, вставки для коротких
+    отрезков и пирамидальная сортировка, если глубина разбиений превышает 2*log2(n).
+    Время O(n log n) в худшем случае, дополнительная память O(log n).
+
+    progress (если задан) вызывается примерно через каждый 1% элементов с
+    числом элементов, уже стоящих на своих местах; чтобы прервать сортировку,
+    он может выбросить SortCancelled.
+    """
+    if hi is None:
+        hi = len(a)
+    if hi - lo < 2:
+        return
+
+    placed = 0
+    report_step = max(1, (hi - lo) // 100)
+    next_report = report_step
+
+    stack = [(lo, hi, 2 * (hi - lo).bit_length())]
+    while stack:
+        lo, hi, depth = stack.pop()
+        while hi - lo > INSERTION_CUTOFF:
+            if depth == 0:
+                _heap_sort(a, lo, hi)
+                placed += hi - lo
+                break
+            depth -= 1
+
+            lt, gt = _partition3(a, lo, hi, _choose_pivot(a, lo, hi))
+            placed += gt - lt
+            # Больший отрезок откладываем в стек, меньший обрабатываем сразу:
+            # так глубина стека не превышает log2(n).
+            if lt - lo < hi - gt:
+                stack.append((gt, hi, depth))
+                hi = lt
+            else:
+                stack.append((lo, lt, depth))
+                lo = gt
+            if progress is not None and placed >= next_report:
+                progress(placed)
+                next_report = placed + report_step
+        else:
+            _insertion_sort(a, lo, hi)
+            placed += hi - lo
+        if progress is not None and placed >= next_report:
+            progress(placed)
+            next_report = placed + report_step
+
+
+def _median3(a: MutableSequence[int], i: int, j: int, k: int) -> int:
+    return _median3_values(a[i], a[j], a[k])
+
+
+def _choose_pivot(a: MutableSequence[int], lo: int, hi: int) -> int:
+    last = hi - 1
+    mid = lo + (hi - lo) // 2
+    if hi - lo <= NINTHER_CUTOFF:
+        return _median3(a, lo, mid, last)
+
+    # "Ninther" Тьюки: медиана трёх медиан.
+    step = (hi - lo) // 8
+    return _median3_values(
+        _median3(a, lo, lo + step, lo + 2 * step),
+        _median3(a, mid - step, mid, mid + step),
+        _median3(a, last - 2 * step, last - step, last),
+    )
+
+
+def _median3_values(x: int, y: int, z: int) -> int:
+    if x < y:
+        if y < z:
+            return y
+        return z if x < z else x
+    if x < z:
+        return x
+    return z if y < z else y
+
+
+def _partition3(a: MutableSequence[int], lo: int, hi: int, pivot: int) -> tuple[int, int]:
+    """Трёхпутевое разбиение Дейкстры.
+
+    После выполнения a[lo:lt] < pivot, a[lt:gt] == pivot, a[gt:hi] > pivot.
+    """
+    lt = lo
+    i = lo
+    gt = hi
+    while i < gt:
+        x = a[i]
         if x < pivot:
-            less.append(x)
+            a[i] = a[lt]
+            a[lt] = x
+            lt += 1
+            i += 1
         elif x > pivot:
-            greater.append(x)
+            gt -= 1
+            a[i] = a[gt]
+            a[gt] = x
         else:
-            equal.append(x)
+            i += 1
+    return lt, gt
+
+
+def _insertion_sort(a: MutableSequence[int], lo: int, hi: int) -> None:
+    for i in range(lo + 1, hi):
+        x = a[i]
+        j = i - 1
+        while j >= lo and a[j] > x:
+            a[j + 1] = a[j]
+            j -= 1
+        a[j + 1] = x
+
+
+def _heap_sort(a: MutableSequence[int], lo: int, hi: int) -> None:
+    n = hi - lo
+    for start in range(n // 2 - 1, -1, -1):
+        _sift_down(a, lo, start, n)
+    for end in range(n - 1, 0, -1):
+        a[lo], a[lo + end] = a[lo + end], a[lo]
+        _sift_down(a, lo, 0, end)
+
 
-    return quick_sort(less) + equal + quick_sort(greater)
+def _sift_down(a: MutableSequence[int], lo: int, root: int, n: int) -> None:
+    x = a[lo + root]
+    while True:
+        child = 2 * root + 1
+        if child >= n:
+            break
+        if child + 1 < n and a[lo + child + 1] > a[lo + child]:
+            child += 1
+        if a[lo + child] <= x:
+            break
+        a[lo + root] = a[lo + child]
+        root = child
+    a[lo + root] = x
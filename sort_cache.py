@@ -0,0 +1,106 @@
+"""Кеш результатов сортировки, адресуемый содержимым массива.
+
+Ключ - хеш содержимого (array_codec.content_hash). Первый уровень - LRU в
+памяти с ограничением по размеру в байтах, второй (необязательный) - таблица
+contents в SqliteStorage, общая для всех запусков приложения. Второй уровень
+только читается: в contents попадают массивы, которые пользователь сохранил
+(SqliteStorage с dedup=True), поэтому его размер ограничен самой историей и
+уменьшается вместе с ней при удалении записей.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence
+
+from array_codec import content_hash, decode_array, encode_array
+from sort_alg import quick_sort
+
+if TYPE_CHECKING:
+    from db_layer import SqliteStorage
+
+
+class SortCache:
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        storage: Optional["SqliteStorage"] = None,
+        sort_func: Callable[..., List[int]] = quick_sort,
+    ):
+        self.max_bytes = max_bytes
+        self.storage = storage
+        self.sort_func = sort_func
+
+        # Отсортированные массивы хранятся в закодированном виде: так размер
+        # записи известен точно, а занимаемая память в ~4 раза меньше списка.
+        self._entries: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.storage_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def sort(self, values: Sequence[int], progress: Optional[Callable[[int], None]] = None) -> List[int]:
+        """Возвращает отсортированную копию values, по возможности из кеша.
+
+        progress передаётся в sort_func при промахе (см. sort_alg.introsort).
+        """
+        digest = content_hash(values)
+        with self._lock:
+            encoded = self._entries.get(digest)
+            if encoded is not None:
+                self._entries.move_to_end(digest)
+                self.memory_hits += 1
+                return decode_array(encoded)
+
+        if self.storage is not None:
+            stored = self.storage.lookup_sorted(digest)
+            if stored is not None:
+                with self._lock:
+                    self.storage_hits += 1
+                self._remember(digest, encode_array(stored))
+                return list(stored)
+
+        if progress is not None:
+            result = self.sort_func(list(values), progress=progress)
+        else:
+            result = self.sort_func(list(values))
+        with self._lock:
+            self.misses += 1
+        self._remember(digest, encode_array(result))
+        return result
+
+    def _remember(self, digest: bytes, encoded: bytes) -> None:
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(digest, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[digest] = encoded
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики попаданий/промахов и текущий размер кеша в памяти."""
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "storage_hits": self.storage_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
@@ -0,0 +1,193 @@
+"""Очередь отложенной записи (write-behind) для save_arrays.
+
+Сохранения из любых потоков складываются в очередь, а отдельный поток
+записывает их пачками одной транзакцией - когда набралось max_batch
+элементов, max_bytes данных или прошло max_delay секунд с первого
+ожидающего элемента. Так один fsync приходится на всю пачку, а не на каждое
+сохранение. Каждый вызов submit получает Future с результатом (ok, сообщение).
+
+Очередь ограничена max_pending элементами: при переполнении submit ждёт
+(обратное давление). Если БД занята другим писателем ("database is locked"),
+запись пачки повторяется с экспоненциальной задержкой и случайным разбросом.
+Соединение потока записи ждёт занятую БД не дольше busy_timeout секунд,
+поэтому паузами между попытками управляет этот цикл, а не обработчик
+занятости SQLite.
+"""
+
+from __future__ import annotations
+
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, List, Optional, Sequence, Tuple
+
+from db_layer import SqliteStorage, is_busy_error
+
+_Item = Tuple[int, Sequence[int], Optional[Sequence[int]]]
+
+
+class QueueFullError(Exception):
+    """Очередь переполнена, и место не освободилось за отведённое время."""
+
+
+class WriteBehindQueue:
+    def __init__(
+        self,
+        storage: SqliteStorage,
+        max_batch: int = 500,
+        max_bytes: int = 8 * 1024 * 1024,
+        max_delay: float = 0.05,
+        max_pending: int = 20_000,
+        max_retries: int = 10,
+        retry_base_delay: float = 0.01,
+        busy_timeout: float = 0.0,
+    ):
+        self.storage = storage
+        self.max_batch = max_batch
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.busy_timeout = busy_timeout
+
+        self._items: Deque[Tuple[_Item, int, Future]] = deque()
+        self._bytes = 0
+        self._first_at = 0.0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._in_flight = 0
+
+        self.batches = 0
+        self.retries = 0
+
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        user_id: int,
+        original: Sequence[int],
+        sorted_values: Optional[Sequence[int]],
+        timeout: Optional[float] = None,
+    ) -> Future:
+        """Ставит сохранение в очередь. Если очередь полна - ждёт до timeout
+        секунд (None - без ограничения), затем выбрасывает QueueFullError.
+        """
+        size = 8 * (len(original) + (len(sorted_values) if sorted_values is not None else 0))
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Очередь записи закрыта")
+            if not self._not_full.wait_for(lambda: self._closed or len(self._items) < self.max_pending, timeout):
+                raise QueueFullError("Очередь записи переполнена")
+            if self._closed:
+                # Очередь закрыли, пока ждали места: поток записи мог уже
+                # завершиться, и такой Future никогда не получил бы результат.
+                raise RuntimeError("Очередь записи закрыта")
+            if not self._items:
+                self._first_at = time.monotonic()
+            self._items.append(((user_id, original, sorted_values), size, future))
+            self._bytes += size
+            # Будим поток записи, если пачка готова или это первый элемент
+            # (с него начинается отсчёт max_delay).
+            if len(self._items) in (1, self.max_batch) or self._bytes >= self.max_bytes:
+                self._not_empty.notify()
+        return future
+
+    def save_arrays(
+        self,
+        user_id: int,
+        original: Sequence[int],
+        sorted_values: Optional[Sequence[int]],
+    ) -> Tuple[bool, str]:
+        """Синхронный вариант с интерфейсом SqliteStorage.save_arrays."""
+        return self.submit(user_id, original, sorted_values).result()
+
+    def flush(self) -> None:
+        """Ждёт, пока будут записаны все поставленные в очередь элементы."""
+        with self._lock:
+            self._first_at = 0.0  # не ждать max_delay
+            self._not_empty.notify()
+            self._idle.wait_for(lambda: not self._items and not self._in_flight)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify()
+            self._not_full.notify_all()
+        self._thread.join()
+
+    def _take_batch(self) -> List[Tuple[_Item, int, Future]]:
+        with self._lock:
+            while True:
+                if self._items:
+                    full = len(self._items) >= self.max_batch or self._bytes >= self.max_bytes
+                    remaining = self._first_at + self.max_delay - time.monotonic()
+                    if full or remaining <= 0 or self._closed:
+                        break
+                    self._not_empty.wait(remaining)
+                elif self._closed:
+                    return []
+                else:
+                    self._not_empty.wait()
+
+            batch = []
+            batch_bytes = 0
+            while self._items and len(batch) < self.max_batch and (not batch or batch_bytes < self.max_bytes):
+                entry = self._items.popleft()
+                batch_bytes += entry[1]
+                # Отменённые до записи сохранения пропускаем; взятые в работу
+                # отменить уже нельзя, и результат им будет выставлен.
+                if entry[2].set_running_or_notify_cancel():
+                    batch.append(entry)
+            self._bytes -= batch_bytes
+            self._in_flight = len(batch)
+            if self._items:
+                self._first_at = time.monotonic()
+            self._not_full.notify_all()
+            if not batch:
+                self._idle.notify_all()
+            return batch
+
+    def _run(self) -> None:
+        try:
+            self.storage.set_busy_timeout(self.busy_timeout)
+        except sqlite3.Error:
+            pass  # БД недоступна - ошибку получит запись первой пачки
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                if self._closed and not self._items:
+                    return
+                continue  # вся пачка была отменена
+            items = [item for item, _, _ in batch]
+            try:
+                results = self._write_with_retry(items)
+            except Exception as e:
+                results = [(False, f"Ошибка сохранения: {e}")] * len(batch)
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+            self.batches += 1
+            with self._lock:
+                self._in_flight = 0
+                self._idle.notify_all()
+
+    def _write_with_retry(self, items: List[_Item]) -> List[Tuple[bool, str]]:
+        attempt = 0
+        while True:
+            try:
+                return self.storage.save_arrays_batch(items)
+            except sqlite3.OperationalError as e:
+                if attempt >= self.max_retries or not is_busy_error(e):
+                    raise
+                # Полный разброс (full jitter): задержка равномерно в [0, base * 2^attempt].
+                time.sleep(random.uniform(0, self.retry_base_delay * (2**attempt)))
+                attempt += 1
+                self.retries += 1